@@ -0,0 +1,185 @@
+"""
+Поиск аномальных дней по магазинам и товарам.
+
+Из data_clean строится матрица (ряд x день) — выручка или количество продаж
+для каждого магазина, товара или пары магазин-товар. Для всех рядов сразу
+считается робастный z-показатель относительно скользящего окна предыдущих дней:
+
+    z = (x - медиана) / (1.4826 * MAD)
+
+где MAD — медианное абсолютное отклонение в окне. Вычисления идут блоками
+рядов средствами NumPy, без циклов по отдельным рядам, поэтому масштабируются
+до сотен тысяч рядов. Отдельно отмечаются дни, когда по ряду было поступление,
+но не было ни одной продажи.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+SERIES_KEYS = {
+    'store': ['Адрес магазина'],
+    'sku': ['Артикул', 'Название товара'],
+    'store_sku': ['Адрес магазина', 'Артикул', 'Название товара'],
+}
+
+METRIC_COLUMNS = {
+    'revenue': 'Сумма операции',
+    'quantity': 'Количество упаковок, шт.',
+}
+
+# Ограничение на число элементов окна (ряды x дни x окно) в одном блоке
+_BLOCK_ELEMENTS = 8_000_000
+
+
+def _series_matrix(codes, day_codes, weights, first_series, n_series, n_days):
+    """Плотная матрица (ряд x день) для блока рядов [first_series, first_series + n_series)."""
+    flat = (codes - first_series) * n_days + day_codes
+    matrix = np.bincount(flat, weights=weights, minlength=n_series * n_days)
+    return matrix.reshape(n_series, n_days)
+
+
+def _window_median(windows, counts):
+    """
+    Медиана по последней оси окон, где в окне ряда s и дня t заполнены (не NaN) только
+    counts[s, t] значений. NaN при сортировке уходят в конец, поэтому медиана
+    берётся по позициям (counts-1)//2 и counts//2 — без медленного nanmedian.
+    """
+    ordered = np.sort(windows, axis=2)
+    lo = np.maximum((counts - 1) // 2, 0)[:, :, None]
+    hi = np.maximum(counts // 2, 0)[:, :, None]
+    median = (np.take_along_axis(ordered, lo, axis=2) + np.take_along_axis(ordered, hi, axis=2))[:, :, 0] / 2
+    median[counts == 0] = np.nan
+    return median
+
+
+def _robust_z(matrix, window, min_history, series_start=None):
+    """
+    Медиана, MAD и робастный z каждого дня относительно window предыдущих дней.
+    series_start — номер первого дня каждого ряда (первое движение): более ранние дни
+    не нули, а отсутствие истории, в окна и в min_history они не попадают.
+    Дни с историей короче min_history и ряды с нулевым разбросом дают NaN.
+    """
+    n_series, n_days = matrix.shape
+    if series_start is None:
+        series_start = np.zeros(n_series, dtype=np.int64)
+    day = np.arange(n_days)
+    matrix = np.where(day[None, :] >= series_start[:, None], matrix, np.nan)
+    padded = np.concatenate([np.full((n_series, window), np.nan), matrix], axis=1)
+    # windows[:, t, :] — значения дней t-window .. t-1
+    windows = sliding_window_view(padded, window, axis=1)[:, :n_days, :]
+    history = np.clip(day[None, :] - series_start[:, None], 0, window)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        median = _window_median(windows, history)
+        mad = _window_median(np.abs(windows - median[:, :, None]), history)
+        scale = 1.4826 * mad
+        z = (matrix - median) / scale
+
+    z[history < min_history] = np.nan
+    z[~(scale > 0)] = np.nan
+    return median, z
+
+
+def detect_anomalies(data_clean, by='store', metric='revenue', window=28, threshold=3.5,
+                     min_history=7):
+    """
+    Находит аномальные дни для всех рядов одновременно.
+    Параметры:
+        data_clean (pd.DataFrame): Очищенные данные
+        by (str): 'store' — по магазинам, 'sku' — по товарам, 'store_sku' — по парам
+        metric (str): 'revenue' — выручка, 'quantity' — количество упаковок
+        window (int): Длина скользящего окна предыдущих дней
+        threshold (float): Порог |z|, начиная с которого день считается аномальным
+        min_history (int): Минимум дней истории в окне для оценки
+    Возвращает:
+        pd.DataFrame: Аномалии, отсортированные по убыванию |z|. Столбцы: ключи ряда,
+                      'Дата', 'Значение', 'Медиана', 'Робастный_z', 'Тип аномалии'.
+                      'Поступление без продаж' идут в конце (z для них не определён).
+    """
+    if data_clean is None or len(data_clean) == 0:
+        logger.warning("Нет данных для поиска аномалий.")
+        return None
+    if by not in SERIES_KEYS or metric not in METRIC_COLUMNS:
+        logger.error(f"НЕВЕРНЫЕ ПАРАМЕТРЫ: by={by}, metric={metric}. "
+                     f"Допустимо: by {list(SERIES_KEYS)}, metric {list(METRIC_COLUMNS)}")
+        return None
+
+    try:
+        keys = SERIES_KEYS[by]
+        operations = data_clean[data_clean['Тип операции'].isin(['Продажа', 'Поступление'])]
+        if len(operations) == 0:
+            logger.warning("Нет данных о продажах и поступлениях.")
+            return None
+
+        # Коды рядов и дней (календарные дни от первой даты)
+        series_codes, series_index = pd.MultiIndex.from_frame(operations[keys]).factorize()
+        days = operations['Дата'].dt.normalize()
+        first_day = days.min()
+        day_codes = (days - first_day).dt.days.to_numpy()
+        n_series, n_days = len(series_index), int(day_codes.max()) + 1
+        # Ряд начинается с первой продажи или поступления, а не с первого дня выгрузки
+        series_start = np.full(n_series, n_days, dtype=np.int64)
+        np.minimum.at(series_start, series_codes, day_codes)
+
+        is_sale = (operations['Тип операции'] == 'Продажа').to_numpy()
+        values = operations[METRIC_COLUMNS[metric]].to_numpy(dtype=np.float64)
+        receipts = operations['Количество упаковок, шт.'].to_numpy(dtype=np.float64)
+
+        # Сортируем строки по ряду, чтобы блок рядов был непрерывным срезом
+        order = np.argsort(series_codes, kind='stable')
+        series_codes, day_codes = series_codes[order], day_codes[order]
+        is_sale, values, receipts = is_sale[order], values[order], receipts[order]
+        block = max(1, _BLOCK_ELEMENTS // (n_days * window))
+
+        found = []
+        for start in range(0, n_series, block):
+            stop = min(start + block, n_series)
+            lo, hi = np.searchsorted(series_codes, [start, stop])
+            codes, day = series_codes[lo:hi], day_codes[lo:hi]
+            sale = is_sale[lo:hi]
+
+            sales_matrix = _series_matrix(codes[sale], day[sale], values[lo:hi][sale],
+                                          start, stop - start, n_days)
+            receipt_matrix = _series_matrix(codes[~sale], day[~sale], receipts[lo:hi][~sale],
+                                            start, stop - start, n_days)
+            sale_count = _series_matrix(codes[sale], day[sale], None, start, stop - start, n_days)
+
+            median, z = _robust_z(sales_matrix, window, min_history, series_start[start:stop])
+
+            rows, cols = np.nonzero(np.abs(np.nan_to_num(z)) >= threshold)
+            if len(rows):
+                found.append(pd.DataFrame({
+                    'series': rows + start, 'day': cols,
+                    'Значение': sales_matrix[rows, cols], 'Медиана': median[rows, cols],
+                    'Робастный_z': z[rows, cols],
+                    'Тип аномалии': np.where(z[rows, cols] > 0, 'Всплеск', 'Провал')}))
+
+            rows, cols = np.nonzero((receipt_matrix > 0) & (sale_count == 0))
+            if len(rows):
+                found.append(pd.DataFrame({
+                    'series': rows + start, 'day': cols,
+                    'Значение': receipt_matrix[rows, cols], 'Медиана': median[rows, cols],
+                    'Робастный_z': np.nan, 'Тип аномалии': 'Поступление без продаж'}))
+
+        columns = keys + ['Дата', 'Значение', 'Медиана', 'Робастный_z', 'Тип аномалии']
+        if not found:
+            logger.info(f"Аномалий не найдено ({n_series} рядов, {n_days} дней).")
+            return pd.DataFrame(columns=columns)
+
+        anomalies = pd.concat(found, ignore_index=True)
+        key_frame = series_index.take(anomalies['series'].to_numpy()).to_frame(index=False, name=keys)
+        anomalies = pd.concat([key_frame, anomalies], axis=1)
+        anomalies['Дата'] = first_day + pd.to_timedelta(anomalies['day'], unit='D')
+        anomalies['_rank'] = anomalies['Робастный_z'].abs()
+        anomalies = anomalies.sort_values('_rank', ascending=False, na_position='last', kind='stable')
+
+        logger.info(f"Найдено {len(anomalies)} аномалий ({n_series} рядов, {n_days} дней).")
+        return anomalies[columns].reset_index(drop=True)
+
+    except Exception as e:
+        logger.error(f"ОШИБКА ПРИ ПОИСКЕ АНОМАЛИЙ: {e}")
+        return None
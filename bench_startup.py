@@ -0,0 +1,56 @@
+"""
+Замер холодного старта: сколько стоит импорт manager.py в новом интерпретаторе
+с ленивой загрузкой графических библиотек и с их немедленной загрузкой
+(как было раньше, когда matplotlib и seaborn импортировались при загрузке модуля).
+
+Запуск:
+    python bench_startup.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCENARIOS = {
+    'текстовый режим (ленивый импорт)':
+        "import manager; manager.InventoryManager()",
+    'с графиками (прежнее поведение)':
+        "import manager; manager.InventoryManager(); manager._load_plotting()",
+}
+
+
+def measure(code, runs):
+    """Запускает код в новом интерпретаторе runs раз и возвращает времена в секундах."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True,
+                       env=dict(os.environ, MPLBACKEND='Agg'))
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер времени холодного старта")
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    # Прогрев файлового кэша ОС и __pycache__
+    for code in SCENARIOS.values():
+        measure(code, 1)
+
+    results = {}
+    for name, code in SCENARIOS.items():
+        timings = measure(code, args.runs)
+        results[name] = statistics.median(timings)
+        print(f"{name:<35} медиана {results[name] * 1000:8.1f} мс "
+              f"(мин {min(timings) * 1000:.1f}, макс {max(timings) * 1000:.1f}, n={args.runs})")
+
+    lazy, eager = results.values()
+    print(f"Экономия на старте: {(eager - lazy) * 1000:.1f} мс ({(1 - lazy / eager) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
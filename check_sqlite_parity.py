@@ -0,0 +1,95 @@
+"""
+Сверка SQLite-бэкенда с pandas-функциями process.py (sqlite_backend.check_parity).
+
+Данные для сверки генерируются так, чтобы покрыть расхождения, которые
+легко пропустить на чистой выгрузке: товары без названия, товары только
+с поступлениями или только с продажами, дробные цены, несколько лет истории
+(недели, месяцы, кварталы, годы и финансовые периоды со сдвигом года).
+Результаты сравниваются точно. Дробные цены кратны 0.25 руб.: суммы таких
+чисел в float64 не зависят от порядка сложения, который у pandas и SQLite разный.
+Дополнительно сверяются реальные выгрузки, если они лежат рядом.
+
+Запуск (код возврата 1 при любом расхождении):
+    python check_sqlite_parity.py
+    python check_sqlite_parity.py --files "Данные 1.csv" "Данные 2.csv"
+"""
+import argparse
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from process import load_sales_data, preprocess_data
+from sqlite_backend import check_parity
+
+DEFAULT_FILES = ["Данные 1.csv", "Данные 2.csv"]
+
+
+def synthetic_data(rows=20_000, products=60, days=3 * 365, seed=0):
+    """Очищенная таблица (как data_clean) со случайными операциями."""
+    rng = np.random.default_rng(seed)
+    # Популярность товаров сильно различается: есть и лидеры, и "застоявшиеся"
+    popularity = 1 / np.arange(1, products + 1) ** 1.5
+    sku = rng.choice(np.arange(1, products + 1), size=rows, p=popularity / popularity.sum())
+    names = np.array([f'Товар {i}' for i in range(products + 1)], dtype=object)
+    name = pd.Series(names[sku], dtype='str')
+    # Часть товаров без названия (в pandas такие группы отбрасываются),
+    # у одного товара название пропущено только в части строк
+    name[sku % 10 == 3] = np.nan
+    name[(sku == 2) & (rng.random(rows) < 0.1)] = np.nan
+    operation = np.where(rng.random(rows) < 0.6, 'Продажа', 'Поступление')
+    operation[np.isin(sku, [5, 6])] = 'Поступление'   # только поступления
+    operation[sku == 7] = 'Продажа'                   # только продажи
+    quantity = rng.integers(1, 20, size=rows)
+    price = rng.integers(40, 2000, size=rows) / 4
+    stores = np.array(['ул. Ленина, 1', 'ул. Мира, 5', 'пр. Победы, 10'], dtype=object)
+    store = rng.integers(0, len(stores), size=rows)
+    data = pd.DataFrame({
+        'ID операции': np.arange(1, rows + 1),
+        'Дата': pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, days, size=rows), unit='D'),
+        'Адрес магазина': pd.Series(stores[store], dtype='str'),
+        'Район магазина': pd.Series(np.array(['Центр', 'Север', 'Юг'], dtype=object)[store], dtype='str'),
+        'Артикул': sku,
+        'Название товара': name,
+        'Отдел товара': pd.Series(np.array(['Бакалея', 'Напитки', 'Молочные'], dtype=object)[sku % 3],
+                                  dtype='str'),
+        'Количество упаковок, шт.': quantity,
+        'Тип операции': pd.Series(operation, dtype='str'),
+        'Цена руб./шт.': price,
+    })
+    data['Сумма операции'] = data['Количество упаковок, шт.'] * data['Цена руб./шт.']
+    return data.sort_values('Дата', kind='stable').reset_index(drop=True)
+
+
+def report(title, results):
+    failed = [name for name, ok in results.items() if not ok]
+    print(f"{title}: {len(results) - len(failed)}/{len(results)} совпадений"
+          + (f", расхождения: {', '.join(failed)}" if failed else ""))
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сверка результатов SQLite и pandas")
+    parser.add_argument('--files', nargs='+', default=DEFAULT_FILES,
+                        help="Реальные выгрузки для дополнительной сверки (пропускаются, если их нет)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    data = synthetic_data()
+    ok = report("Синтетические данные", check_parity(data, as_of=data['Дата'].max()))
+
+    frames = [load_sales_data(f) for f in args.files if os.path.exists(f)]
+    frames = [f for f in frames if f is not None]
+    if frames:
+        data = preprocess_data(pd.concat(frames, ignore_index=True))
+        if data is not None:
+            ok = report("Выгрузки " + ', '.join(f for f in args.files if os.path.exists(f)),
+                        check_parity(data, as_of=data['Дата'].max())) and ok
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
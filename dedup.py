@@ -0,0 +1,103 @@
+"""
+Дедупликация операций при загрузке пересекающихся выгрузок.
+
+Каждой строке сопоставляется 64-битный ключ: хэш 'ID операции', а для строк
+без ID — отпечаток (хэш) всех остальных столбцов. Индекс уже встреченных ключей
+хранится в памяти и, при указании пути, сохраняется на диск (.npy), поэтому
+работает и между запусками. Проверка выполняется хэш-поиском за O(n).
+"""
+import hashlib
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ID_COLUMN = 'ID операции'
+
+
+def row_keys(data):
+    """
+    Возвращает массив uint64-ключей строк: хэш ID операции или,
+    если ID нет, отпечаток содержимого строки.
+    """
+    keys = np.zeros(len(data), dtype=np.uint64)
+    has_id = np.zeros(len(data), dtype=bool)
+
+    if ID_COLUMN in data.columns:
+        # 12 и 12.0 — один и тот же ID (столбец становится float при пропусках)
+        ids = (data[ID_COLUMN].astype('string').str.strip()
+               .str.replace(r'\.0$', '', regex=True))
+        has_id = (ids.notna() & (ids != '')).to_numpy()
+        if has_id.any():
+            keys[has_id] = pd.util.hash_pandas_object(
+                'id:' + ids[has_id], index=False).to_numpy()
+
+    if not has_id.all():
+        content_cols = [c for c in data.columns if c != ID_COLUMN]
+        content = data.loc[~has_id, content_cols].astype(str)
+        keys[~has_id] = pd.util.hash_pandas_object(content, index=False).to_numpy()
+
+    return keys
+
+
+class DeduplicationIndex:
+    """
+    Индекс уже загруженных операций.
+    path=None — индекс только в памяти (дедупликация в пределах одного запуска);
+    иначе индекс читается из файла и сохраняется методом save().
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.removed_by_source = {}
+        self._seen = np.array([], dtype=np.uint64)
+        if path and os.path.exists(path):
+            self._seen = np.load(path)
+            logger.info(f"Индекс дедупликации {path}: {len(self._seen)} ключей.")
+
+    def __len__(self):
+        return len(self._seen)
+
+    def state(self):
+        """
+        Отпечаток индекса (путь и хэш уже встреченных ключей). Результат загрузки
+        через индекс зависит от его содержимого, поэтому отпечаток входит в ключ кэша.
+        """
+        digest = hashlib.sha1(np.sort(self._seen).tobytes()).hexdigest()
+        return f"{os.path.abspath(self.path) if self.path else 'memory'}|{len(self._seen)}|{digest}"
+
+    def filter(self, data, source=None):
+        """
+        Удаляет из data строки, уже встречавшиеся ранее (в этом или прошлых файлах),
+        и добавляет ключи оставшихся строк в индекс.
+        """
+        if data is None or len(data) == 0:
+            return data
+
+        keys = row_keys(data)
+        key_series = pd.Series(keys)
+        duplicate = key_series.duplicated().to_numpy() | key_series.isin(self._seen).to_numpy()
+        removed = int(duplicate.sum())
+
+        self._seen = np.concatenate([self._seen, keys[~duplicate]])
+        if source is not None:
+            self.removed_by_source[source] = self.removed_by_source.get(source, 0) + removed
+        if removed > 0:
+            logger.info(f"Удалено {removed} дублирующихся операций" +
+                        (f" из {source}" if source is not None else ""))
+        return data[~duplicate].reset_index(drop=True)
+
+    def save(self):
+        """Сохраняет индекс на диск (если задан путь)."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp.npy'
+        np.save(tmp_path, self._seen)
+        os.replace(tmp_path, self.path)
+        logger.info(f"Индекс дедупликации сохранён: {self.path} ({len(self._seen)} ключей).")
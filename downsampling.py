@@ -0,0 +1,79 @@
+"""
+Прореживание длинных временных рядов перед отрисовкой.
+
+На многолетних дневных данных график из тысяч маркеров или столбцов рисуется
+долго и не читается. Здесь — выбор подмножества точек, сохраняющего форму ряда:
+    lttb           — Largest-Triangle-Three-Buckets для линий;
+    minmax_indices — минимум и максимум каждого интервала (огибающая) для столбцов;
+    top_k_indices  — k наибольших по модулю значений, которые стоит подписать.
+Все функции возвращают индексы исходных точек, поэтому даты и значения
+берутся из исходной таблицы без искажений. Число точек на выходе
+не зависит от длины истории — время отрисовки остаётся примерно постоянным.
+"""
+import numpy as np
+
+
+def _as_float(x):
+    """Даты и числа -> float64 (даты — в наносекундах от эпохи)."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb(x, y, n_out):
+    """
+    Индексы n_out точек ряда (x, y), выбранных алгоритмом LTTB.
+    Первая и последняя точки сохраняются всегда. Если точек не больше n_out,
+    возвращаются все индексы.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x, y = _as_float(x), _as_float(y)
+
+    # Границы n_out - 2 внутренних интервалов (первая и последняя точки — отдельно)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Среднее каждого интервала — третья вершина треугольника для предыдущего интервала
+    x_mean = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    y_mean = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    x_mean = np.append(x_mean, x[-1])
+    y_mean = np.append(y_mean, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        cx, cy = x_mean[i + 1], y_mean[i + 1]
+        # Удвоенная площадь треугольника (a, точка интервала, среднее следующего интервала)
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_buckets):
+    """
+    Индексы минимума и максимума каждого из n_buckets интервалов (отсортированы,
+    без повторов). Сохраняет все пики и провалы — подходит для столбчатых графиков.
+    """
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+    y = _as_float(y)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    # Сортировка по (интервал, значение): первая и последняя позиции интервала — min и max
+    order = np.lexsort((y, bucket))
+    starts, ends = edges[:-1], edges[1:] - 1
+    return np.unique(np.concatenate([order[starts], order[ends]]))
+
+
+def top_k_indices(values, k):
+    """Индексы k наибольших по модулю значений (по убыванию модуля)."""
+    values = np.abs(_as_float(values))
+    if k >= len(values):
+        return np.argsort(-values, kind='stable')
+    top = np.argpartition(-values, k)[:k]
+    return top[np.argsort(-values[top], kind='stable')]
@@ -0,0 +1,143 @@
+"""
+Выгрузка полных таблиц результатов для BI.
+
+Каждая таблица анализа (дневные ряды, отделы, товары, оборачиваемость,
+медленно движущиеся товары, ABC/XYZ, аномалии) записывается целиком в один
+или несколько форматов: Parquet и Feather (нужен pyarrow) и CSV / JSON Lines.
+Таблицы строятся по одной и пишутся на диск порциями по chunksize строк,
+поэтому в памяти одновременно находится только одна таблица-результат.
+"""
+import logging
+import os
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'csv': '.csv',
+    'jsonl': '.jsonl',
+}
+
+# Форматы, которым нужен pyarrow
+ARROW_FORMATS = ('parquet', 'feather')
+
+
+def _load_pyarrow():
+    """Импортирует pyarrow по требованию; None, если библиотека не установлена."""
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401 — регистрирует pyarrow.parquet
+        import pyarrow.ipc  # noqa: F401
+        return pyarrow
+    except ImportError:
+        return None
+
+
+def iter_chunks(frame, chunksize=100_000):
+    """Последовательные срезы frame по chunksize строк."""
+    for start in range(0, len(frame), chunksize):
+        yield frame.iloc[start:start + chunksize]
+
+
+def write_table(frame, path, fmt, chunksize=100_000):
+    """
+    Записывает таблицу в файл path в формате fmt порциями по chunksize строк.
+    Возвращает число записанных строк или None при ошибке.
+    """
+    if fmt not in FORMATS:
+        logger.error(f"НЕИЗВЕСТНЫЙ ФОРМАТ ВЫГРУЗКИ: {fmt}. Допустимо: {list(FORMATS)}")
+        return None
+    tmp_path = path + '.tmp'
+    try:
+        if fmt == 'csv':
+            # Первая порция пишет заголовок (и пустую таблицу), следующие дописываются
+            frame.iloc[:0].to_csv(tmp_path, index=False, encoding='utf-8-sig')
+            for chunk in iter_chunks(frame, chunksize):
+                chunk.to_csv(tmp_path, mode='a', header=False, index=False, encoding='utf-8')
+        elif fmt == 'jsonl':
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for chunk in iter_chunks(frame, chunksize):
+                    text = chunk.to_json(orient='records', lines=True, force_ascii=False,
+                                         date_format='iso')
+                    f.write(text if text.endswith('\n') else text + '\n')
+        else:
+            pa = _load_pyarrow()
+            if pa is None:
+                logger.warning(f"Формат {fmt} требует pyarrow (pip install pyarrow) — пропущен.")
+                return None
+            schema = pa.Schema.from_pandas(frame, preserve_index=False)
+            if fmt == 'parquet':
+                writer = pa.parquet.ParquetWriter(tmp_path, schema)
+            else:
+                writer = pa.ipc.new_file(tmp_path, schema)
+            with writer:
+                for chunk in iter_chunks(frame, chunksize):
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        os.replace(tmp_path, path)
+        return len(frame)
+    except Exception as e:
+        logger.error(f"ОШИБКА ПРИ ВЫГРУЗКЕ {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+def analysis_tables(manager):
+    """
+    Имена таблиц и функции, строящие их полные версии через InventoryManager.
+    Таблица строится только в момент выгрузки.
+    """
+    return {
+        'revenue_daily': lambda: manager.analyze_revenue(period='D'),
+        'profit_daily': lambda: manager.analyze_profit(period='D'),
+        'gross_margin_daily': lambda: manager.analyze_margin(period='D'),
+        'gross_margin_by_sku_daily': lambda: manager.analyze_margin(period='D', by='sku'),
+        'gross_margin_by_department_daily': lambda: manager.analyze_margin(period='D', by='department'),
+        'gross_margin_by_store_daily': lambda: manager.analyze_margin(period='D', by='store'),
+        'category_stats': lambda: manager.analyze_by_category(),
+        'product_sales': lambda: manager.top_products(n=None, metric='revenue'),
+        'inventory_turnover': lambda: manager.inventory_turnover(top_n=None),
+        'slow_moving_items': lambda: manager.get_slow_moving_items_report(),
+        'abc_xyz': lambda: manager.abc_xyz_classification(),
+        'anomalies_by_store': lambda: manager.find_anomalies(by='store'),
+    }
+
+
+def export_results(manager, output_dir='exports', formats=('parquet', 'csv'), chunksize=100_000,
+                   tables=None):
+    """
+    Выгружает полные таблицы анализов в output_dir: по файлу на таблицу и формат.
+    tables — список имён из analysis_tables (по умолчанию все).
+    Возвращает DataFrame-манифест: таблица, формат, файл, число строк.
+    """
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        logger.error(f"НЕИЗВЕСТНЫЕ ФОРМАТЫ ВЫГРУЗКИ: {unknown}. Допустимо: {list(FORMATS)}")
+        return None
+    if any(fmt in ARROW_FORMATS for fmt in formats) and _load_pyarrow() is None:
+        logger.warning("pyarrow не установлен: Parquet/Feather будут пропущены.")
+        formats = [fmt for fmt in formats if fmt not in ARROW_FORMATS]
+
+    builders = analysis_tables(manager)
+    if tables is not None:
+        builders = {name: builders[name] for name in tables if name in builders}
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = []
+    for name, build in builders.items():
+        table = build()
+        if table is None:
+            logger.warning(f"Таблица {name} не построена — пропущена.")
+            continue
+        for fmt in formats:
+            path = os.path.join(output_dir, name + FORMATS[fmt])
+            rows = write_table(table, path, fmt, chunksize=chunksize)
+            if rows is not None:
+                manifest.append({'Таблица': name, 'Формат': fmt, 'Файл': path, 'Строк': rows})
+        del table
+
+    logger.info(f"Выгружено файлов: {len(manifest)} в {output_dir}")
+    return pd.DataFrame(manifest, columns=['Таблица', 'Формат', 'Файл', 'Строк'])
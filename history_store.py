@@ -0,0 +1,260 @@
+"""
+Постоянное колоночное хранилище истории продаж (очищенная таблица data_clean).
+
+Структура каталога хранилища:
+    meta.json                   — схема столбцов и список сегментов
+    dict/c<i>.json              — словари строковых столбцов (значение -> код = позиция)
+    segments/<дата>_<n>/c<i>.npy — один NumPy-массив на столбец в каждом сегменте
+
+Каждый сегмент содержит строки за один день. Добавление нового дня пишет новый
+сегмент и не переписывает существующие. Строковые столбцы хранятся как коды
+int32 в словаре. При чтении массивы открываются через memory-map (np.load(mmap_mode='r')),
+поэтому с диска читаются только страницы выбранных столбцов и дат; строковые
+столбцы возвращаются как pd.Categorical, без развёртывания в строки.
+
+Без копирования отдаются только числовые столбцы одного сегмента: iter_segments()
+обходит диапазон по дням, а read() за один день возвращает массивы поверх файлов.
+read() за несколько дней склеивает сегменты (np.concatenate), то есть копирует
+выбранные столбцы диапазона в память.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DATE_COLUMN = 'Дата'
+META_FILE = 'meta.json'
+
+
+def _write_json(path, obj):
+    """Атомарная запись JSON: сначала во временный файл, затем замена."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _numeric_array(values, dtype):
+    """
+    Числовой массив сегмента. Тип схемы расширяется, если в сегменте есть
+    пропуски или дробные значения: при чтении NumPy приводит сегменты к общему типу.
+    """
+    if values.hasnans:
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    array = values.to_numpy()
+    return array.astype(np.result_type(np.dtype(dtype), array.dtype), copy=False)
+
+
+class HistoryStore:
+    """
+    Колоночное хранилище с сегментами по датам.
+    Открытие хранилища читает только meta.json — данные не загружаются,
+    пока не вызван read().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = []       # [{'name': ..., 'kind': 'date' | 'dict' | 'numeric', 'dtype': ...}]
+        self.segments = []      # [{'name': ..., 'date': 'YYYY-MM-DD', 'rows': n}]
+        self._dictionaries = {}
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            self.columns = meta['columns']
+            self.segments = meta['segments']
+
+    def __len__(self):
+        return sum(segment['rows'] for segment in self.segments)
+
+    def dates(self):
+        """Список дат (pd.Timestamp), для которых в хранилище есть сегменты."""
+        return sorted({pd.Timestamp(segment['date']) for segment in self.segments})
+
+    def _save_meta(self):
+        _write_json(os.path.join(self.path, META_FILE),
+                    {'columns': self.columns, 'segments': self.segments})
+
+    def _dictionary(self, i):
+        """Словарь i-го строкового столбца (загружается один раз)."""
+        if i not in self._dictionaries:
+            dict_path = os.path.join(self.path, 'dict', f'c{i}.json')
+            values = []
+            if os.path.exists(dict_path):
+                with open(dict_path, encoding='utf-8') as f:
+                    values = json.load(f)
+            self._dictionaries[i] = values
+        return self._dictionaries[i]
+
+    def _init_schema(self, data):
+        """Фиксирует схему хранилища по первому добавляемому DataFrame."""
+        for name in data.columns:
+            if name == DATE_COLUMN:
+                # Дата берётся из метаданных сегмента и на диске не хранится
+                self.columns.append({'name': name, 'kind': 'date', 'dtype': 'datetime64[ns]'})
+                continue
+            dtype = data[name].dtype
+            if pd.api.types.is_numeric_dtype(dtype):
+                self.columns.append({'name': name, 'kind': 'numeric', 'dtype': str(np.dtype(dtype))})
+            else:
+                self.columns.append({'name': name, 'kind': 'dict', 'dtype': 'int32'})
+
+    def _encode(self, i, values):
+        """
+        Кодирует строки словарём i-го столбца, пополняя словарь новыми значениями.
+        Значения и словарь сравниваются как есть, поэтому в столбце допустимы
+        только строки и пропуски (проверяется в append).
+        """
+        dictionary = self._dictionary(i)
+        values = values.astype(object)
+        codes = pd.Index(dictionary, dtype=object).get_indexer(values)
+        new_mask = (codes == -1) & values.notna().to_numpy()
+        if new_mask.any():
+            dictionary.extend(pd.unique(values[new_mask]))
+            codes = pd.Index(dictionary, dtype=object).get_indexer(values)
+        return codes.astype(np.int32)
+
+    def append(self, data):
+        """
+        Добавляет строки в хранилище: по одному новому сегменту на каждый день.
+        Существующие сегменты не переписываются.
+        Возвращает количество записанных сегментов.
+        """
+        if data is None or len(data) == 0:
+            logger.warning("Нет данных для записи в хранилище истории.")
+            return 0
+
+        os.makedirs(os.path.join(self.path, 'segments'), exist_ok=True)
+        os.makedirs(os.path.join(self.path, 'dict'), exist_ok=True)
+
+        if not self.columns:
+            self._init_schema(data)
+        missing = [c['name'] for c in self.columns if c['name'] not in data.columns]
+        if missing:
+            logger.error(f"В ДОБАВЛЯЕМЫХ ДАННЫХ НЕТ СТОЛБЦОВ ХРАНИЛИЩА: {missing}")
+            return 0
+        # Словарь хранит строки: числа, bool или смешанные значения в строковом
+        # столбце не совпали бы с ним и прочитались бы как пропуски
+        not_strings = [c['name'] for c in self.columns if c['kind'] == 'dict'
+                       and pd.api.types.infer_dtype(data[c['name']], skipna=True) not in ('string', 'empty')]
+        if not_strings:
+            logger.error(f"В СТРОКОВЫХ СТОЛБЦАХ ХРАНИЛИЩА ЕСТЬ НЕСТРОКОВЫЕ ЗНАЧЕНИЯ: {not_strings}")
+            return 0
+
+        days = pd.to_datetime(data[DATE_COLUMN]).dt.normalize()
+        existing_names = {segment['name'] for segment in self.segments}
+        written = 0
+
+        for day, day_data in data.groupby(days, sort=True):
+            date_str = day.strftime('%Y-%m-%d')
+            n = 0
+            while f'{date_str}_{n:03d}' in existing_names:
+                n += 1
+            name = f'{date_str}_{n:03d}'
+            segment_dir = os.path.join(self.path, 'segments', name)
+            os.makedirs(segment_dir, exist_ok=True)
+
+            for i, column in enumerate(self.columns):
+                if column['kind'] == 'date':
+                    continue
+                values = day_data[column['name']]
+                if column['kind'] == 'dict':
+                    array = self._encode(i, values)
+                else:
+                    array = _numeric_array(values, column['dtype'])
+                np.save(os.path.join(segment_dir, f'c{i}.npy'), array)
+
+            self.segments.append({'name': name, 'date': date_str, 'rows': len(day_data)})
+            existing_names.add(name)
+            written += 1
+
+        # Словари пишем до meta.json: сегменты становятся видны только после обновления метаданных
+        for i in self._dictionaries:
+            _write_json(os.path.join(self.path, 'dict', f'c{i}.json'), self._dictionaries[i])
+        self._save_meta()
+
+        logger.info(f"В хранилище {self.path} записано {written} сегментов, {len(data)} строк.")
+        return written
+
+    def _select(self, start=None, end=None):
+        """Сегменты (segment, дата) в диапазоне дат [start, end] в порядке дат."""
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        selected = []
+        for segment in sorted(self.segments, key=lambda s: s['name']):
+            date = pd.Timestamp(segment['date'])
+            if (start is None or date >= start) and (end is None or date <= end):
+                selected.append((segment, date))
+        return selected
+
+    def _wanted(self, columns):
+        """Список читаемых столбцов или None, если среди них есть неизвестные."""
+        wanted = [c['name'] for c in self.columns] if columns is None else list(columns)
+        unknown = [name for name in wanted if name not in {c['name'] for c in self.columns}]
+        if unknown:
+            logger.error(f"В ХРАНИЛИЩЕ НЕТ СТОЛБЦОВ: {unknown}")
+            return None
+        return wanted
+
+    def _frame(self, selected, wanted):
+        """
+        DataFrame из сегментов selected. Числовые столбцы одного сегмента остаются
+        отображёнными в память; несколько сегментов склеиваются с копированием.
+        """
+        result = {}
+        for i, column in enumerate(self.columns):
+            if column['name'] not in wanted:
+                continue
+            if column['kind'] == 'date':
+                result[column['name']] = np.repeat(
+                    np.array([date for _, date in selected], dtype='datetime64[ns]'),
+                    [segment['rows'] for segment, _ in selected])
+                continue
+            parts = [np.load(os.path.join(self.path, 'segments', segment['name'], f'c{i}.npy'),
+                             mmap_mode='r')
+                     for segment, _ in selected]
+            if len(parts) == 1:
+                array = parts[0]
+            else:
+                array = np.concatenate(parts) if parts else np.array([], dtype=column['dtype'])
+            if column['kind'] == 'dict':
+                # Код -1 — пропуск, как в pd.Categorical. Категории упорядочены как строки,
+                # чтобы сортировка и группировка давали тот же порядок, что и для str
+                array = pd.Categorical.from_codes(array, categories=pd.Index(self._dictionary(i), dtype='str'))
+                array = array.reorder_categories(array.categories.sort_values())
+            result[column['name']] = array
+        return pd.DataFrame(result, copy=False)[wanted]
+
+    def iter_segments(self, columns=None, start=None, end=None):
+        """
+        Обходит сегменты в диапазоне дат [start, end] по одному: выдаёт (дата, DataFrame).
+        Числовые столбцы каждого сегмента не копируются, поэтому в памяти
+        одновременно находится только один день — для длинных диапазонов это
+        дешевле read(). Категории строковых столбцов во всех сегментах одни и те же.
+        """
+        wanted = self._wanted(columns)
+        if wanted is None:
+            return
+        for segment, date in self._select(start, end):
+            yield date, self._frame([(segment, date)], wanted)
+
+    def read(self, columns=None, start=None, end=None):
+        """
+        Собирает DataFrame из сегментов в диапазоне дат [start, end].
+        columns — список нужных столбцов (None — все). Столбец 'Дата'
+        восстанавливается из метаданных сегмента. Строковые столбцы —
+        pd.Categorical со словарём хранилища. Без копирования читается только
+        один сегмент (один день); диапазон из нескольких дней склеивается в новые
+        массивы — для обхода без копирования служит iter_segments().
+        """
+        selected = self._select(start, end)
+        wanted = self._wanted(columns)
+        if wanted is None:
+            return None
+        df = self._frame(selected, wanted)
+        logger.info(f"Из хранилища {self.path} прочитано {len(df)} строк из {len(selected)} сегментов.")
+        return df
@@ -1,134 +1,110 @@
-import os
+import argparse
+import time
 from manager import InventoryManager
-import pandas as pd
+from metrics import LAST_RUN_SUCCESS, LAST_RUN_TIMESTAMP, RUN_SECONDS, start_http_server, write_textfile
+from report import build_text_report, save_report_to_file
+from watcher import watch_folder
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Система анализа продаж и инвентаря")
+    parser.add_argument('--text-only', action='store_true',
+                        help="Только текстовый отчёт, без графиков (быстрый запуск без matplotlib)")
+    parser.add_argument('--cache', metavar='DIR', default=None,
+                        help="Каталог дискового кэша результатов: повторный запуск на тех же "
+                             "файлах не читает исходные строки")
+    parser.add_argument('--export', metavar='DIR', default=None,
+                        help="Выгрузить полные таблицы анализов в каталог DIR")
+    parser.add_argument('--export-format', action='append', default=None,
+                        choices=['parquet', 'feather', 'csv', 'jsonl'],
+                        help="Формат выгрузки (можно указать несколько раз; по умолчанию parquet и csv)")
+    parser.add_argument('--watch', metavar='DIR', default=None,
+                        help="Режим наблюдения: перестраивать отчёт и графики при появлении "
+                             "или изменении CSV-выгрузок в папке DIR")
+    parser.add_argument('--debounce', type=float, default=5.0,
+                        help="Пауза без изменений в папке перед перестроением, сек. (для --watch)")
+    parser.add_argument('--per-store', nargs='?', const='Адрес магазина', default=None,
+                        choices=['Адрес магазина', 'Район магазина'],
+                        help="Дополнительно сформировать отдельные отчёты по каждому магазину "
+                             "(или району) в папке store_reports/")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Число процессов для отчётов по магазинам (по умолчанию — число ядер)")
+    parser.add_argument('--metrics-file', metavar='PATH', default=None,
+                        help="Записать метрики запуска в формате Prometheus (textfile collector); "
+                             "в режиме --watch — после каждого перестроения")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="Отдавать метрики по http://127.0.0.1:PORT/metrics во время работы")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(" Система анализа продаж и инвентаря\n" + "="*50)
 
-def save_report_to_file(report_text, filename="inventory_report.txt"):
-    """Сохраняет отчёт в текстовый файл."""
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(report_text)
-    print(f" Отчёт сохранён в файл: {filename}")
+    if args.metrics_port is not None:
+        start_http_server(args.metrics_port)
 
-def main():
-    print(" Система анализа продаж и инвентаря\n" + "="*50)
+    if args.watch:
+        # Метрики в файл — после каждого перестроения, а не один раз при выходе
+        on_rebuild = (lambda success: write_textfile(args.metrics_file)) if args.metrics_file else None
+        watch_folder(args.watch, debounce=args.debounce, charts=not args.text_only,
+                     on_rebuild=on_rebuild)
+        return
 
+    started = time.perf_counter()
+    success = run_analysis(args)
+    RUN_SECONDS.observe(time.perf_counter() - started)
+    LAST_RUN_TIMESTAMP.set(time.time())
+    LAST_RUN_SUCCESS.set(1 if success else 0)
+    if args.metrics_file:
+        write_textfile(args.metrics_file)
+
+def run_analysis(args):
+    """Полный запуск: загрузка, анализ, отчёты. Возвращает True при успехе."""
     # Инициализация менеджера
     manager = InventoryManager()
+    if args.cache:
+        manager.use_result_cache(args.cache)
 
-    # Загрузка данных
+    # Загрузка и объединение данных
     files = ["Данные 1.csv", "Данные 2.csv"]
-    all_data = []
-
-    for file in files:
-        if os.path.exists(file):
-            if manager.load_data(file):
-                all_data.append(manager.data)
-                print(f" Файл {file} успешно загружен.")
-        else:
-            print(f"Файл {file} не найден. Пропущен.")
-
-    if not all_data:
-        print(" НИ ОДИН ФАЙЛ НЕ БЫЛ ЗАГРУЖЕН. ЗАВЕРШЕНИЕ.")
-        return
-
-    # Объединяем данные
-    manager.data = pd.concat(all_data, ignore_index=True)
-    print(f" Объединено {len(manager.data)} строк из {len([f for f in files if os.path.exists(f)])} файлов.")
+    if not manager.load_files(files, defer=args.cache is not None):
+        print(" ЗАВЕРШЕНИЕ.")
+        return False
 
     # Предобработка
     if not manager.preprocess():
         print("ПЕРЕРАБОТКА ДАННЫХ НЕ УДАЛАСЬ. ЗАВЕРШЕНИЕ.")
-        return
+        return False
 
     # Проверка на минимальный объём данных
-    if len(manager.data_clean) < 10:
+    if manager.processed_rows() < 10:
         print("СЛИШКОМ МАЛО ДАННЫХ ДЛЯ АНАЛИЗА. ЗАВЕРШЕНИЕ.")
-        return
+        return False
 
-    # Анализ
+    # Анализ и формирование текстового отчёта
     print("\n" + "="*50)
     print("НАЧАЛО АНАЛИЗА")
-    
-    # Выручка и прибыль
-    revenue = manager.analyze_revenue(period='D')
-    profit = manager.analyze_profit(period='D')
-
-    # Анализ по категориям
-    category_stats = manager.analyze_by_category()
-
-    # Топ-5 товаров по продажам
-    top_products_qty = manager.top_products(n=5, metric='quantity')
-    top_products_rev = manager.top_products(n=5, metric='revenue')
-
-    # Оборачиваемость
-    turnover_analysis = manager.inventory_turnover(top_n=10)
-   
-   # --- НОВЫЙ АНАЛИЗ: МЕДЛЕННО ДВИЖУЩИЕСЯ ТОВАРЫ ---
-    slow_moving = manager.get_slow_moving_items_report(days_back=90, sales_threshold=5)
-    print("Анализ медленно движущихся товаров завершён.")
-   
-    # Формирование текстового отчёта
-    report = []
-
-    report.append("ОТЧЁТ ПО АНАЛИЗУ ПРОДАЖ И ИНВЕНТАРЯ")
-    report.append("="*70)
-    report.append(f"Дата генерации: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    report.append(f"Обработано строк: {len(manager.data_clean)}")
-    report.append("")
-
-    # Выручка
-    if revenue is not None and not revenue.empty:
-        report.append(" ВЫРУЧКА ПО ДНЯМ (первые 10 записей):")
-        report.append(revenue.head(10).to_string(index=False))
-        report.append("")
-    else:
-        report.append("НЕТ ДАННЫХ О ВЫРУЧКЕ.")
-
-    # Прибыль
-    if profit is not None and not profit.empty:
-        report.append(" ПРИБЫЛЬ ПО ДНЯМ (первые 10 записей):")
-        report.append(profit.head(10).to_string(index=False))
-        report.append("")
-    else:
-        report.append("НЕТ ДАННЫХ О ПРИБЫЛИ.")
-
-    # Категории
-    if category_stats is not None and not category_stats.empty:
-        report.append(" ПРОДАЖИ ПО ОТДЕЛАМ:")
-        report.append(category_stats.to_string())
-        report.append("")
-
-    # Топ-5 по количеству
-    if top_products_qty is not None and not top_products_qty.empty:
-        report.append(" ТОП-5 ТОВАРОВ ПО КОЛИЧЕСТВУ ПРОДАННЫХ ЕДИНИЦ:")
-        report.append(top_products_qty.to_string(index=False))
-        report.append("")
-
-    # Топ-5 по выручке
-    if top_products_rev is not None and not top_products_rev.empty:
-        report.append(" ТОП-5 ТОВАРОВ ПО ВЫРУЧКЕ:")
-        report.append(top_products_rev.to_string(index=False))
-        report.append("")
-
-    # Оборачиваемость
-    if turnover_analysis is not None and not turnover_analysis.empty:
-        report.append(" АНАЛИЗ ОБОРАЧИВАЕМОСТИ ТОВАРОВ (ТОП-10):")
-        report.append(turnover_analysis.to_string(index=False))
-        report.append("")
-
-    # --- МЕДЛЕННО ДВИЖУЩИЕСЯ ТОВАРЫ ---
-    if slow_moving is not None and not slow_moving.empty:
-        report.append(" ТОВАРЫ, КОТОРЫЕ 'ЗАСТОЯЛИСЬ' НА СКЛАДЕ (за 90 дней):")
-        report.append(slow_moving.to_string(index=False))
-        report.append("")
-    else:
-        report.append("  НЕТ ТОВАРОВ, КОТОРЫЕ ЗАСТОЯЛИСЬ НА СКЛАДЕ (все товары активны).")
-        report.append("")
-
-    report.append(" АНАЛИЗ ЗАВЕРШЁН.")
+    report = build_text_report(manager)
 
     # Сохранение текстового отчёта
-    save_report_to_file("\n".join(report))
+    save_report_to_file(report)
+
+    # Полные таблицы для BI: текстовый отчёт остаётся краткой сводкой
+    if args.export:
+        manager.export_tables(output_dir=args.export,
+                              formats=args.export_format or ('parquet', 'csv'))
+
+    # Отчёты по отдельным магазинам/районам (параллельно, по процессу на часть)
+    if args.per_store:
+        manager.generate_partition_reports(by=args.per_store, output_dir='store_reports',
+                                           charts=not args.text_only, max_workers=args.workers)
     
+    if args.text_only:
+        print("\n" + "="*50)
+        print(" ПРОГРАММА УСПЕШНО ЗАВЕРШЕНА (только текстовый отчёт)!")
+        print(" Текстовый отчёт: inventory_report.txt")
+        print("="*50)
+        return True
+
     # --- ВИЗУАЛИЗАЦИЯ ---
     print("\n" + "="*50)
     print(" ГЕНЕРАЦИЯ ГРАФИКОВ И ВИЗУАЛИЗАЦИЙ")
@@ -148,6 +124,7 @@ def main():
     print(" Текстовый отчёт: inventory_report.txt")
     print(" Визуализации: папка 'sales_visualizations/'")
     print("="*50)
+    return True
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,11 @@
+import contextlib
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from process import (
     load_sales_data,
     preprocess_data,
@@ -8,7 +13,11 @@ from process import (
     calculate_profit_by_period,
     aggregate_sales_by_category,
     get_top_n_products,
-    analyze_inventory_turnover
+    analyze_inventory_turnover,
+    classify_abc_xyz,
+    build_daily_rollup,
+    build_star_schema,
+    calculate_gross_margin
 )
 from process import (
     get_operational_data,
@@ -16,24 +25,181 @@ from process import (
     calculate_reorder_point,
     identify_slow_moving_items  # ← НОВАЯ ФУНКЦИЯ
 )
+from history_store import HistoryStore
+from sqlite_backend import SQLiteBackend
+from dedup import DeduplicationIndex
+from sketches import sketch_sales_files
+from anomalies import detect_anomalies
+from report import build_text_report, save_report_to_file
+from result_cache import ResultCache, fingerprint_files, fingerprint_frame
+from exporter import export_results
+from downsampling import lttb, minmax_indices, top_k_indices
+from simulation import simulate_reorder_settings
+from metrics import ANALYSIS_SECONDS, DUPLICATES_REMOVED
+
+# Графические библиотеки (matplotlib, seaborn) импортируются лениво —
+# при первом построении графика. Текстовая аналитика их не загружает.
+plt = None
+sns = None
+
+# Названия периодов для заголовков графиков (финансовые 'Q-MAR', 'Y-MAR' — по префиксу)
+PERIOD_NAMES = {'D': 'дням', 'W': 'неделям', 'M': 'месяцам', 'Q': 'кварталам', 'Y': 'годам'}
+
+
+def _load_plotting(headless=False):
+    """
+    Импортирует matplotlib и seaborn и настраивает стиль графиков; возвращает pyplot.
+    headless=True — бэкенд Agg без окон: графики только сохраняются в файлы
+    (дочерние процессы пакетных отчётов, режим наблюдения).
+    Повторные вызовы ничего не импортируют заново.
+    """
+    global plt, sns
+    if headless:
+        import matplotlib
+        matplotlib.use('Agg')
+    if plt is None:
+        import matplotlib.pyplot as _plt
+        import seaborn as _sns
+        # Настройка стиля графиков
+        _plt.style.use('seaborn-v0_8-darkgrid')
+        _sns.set_palette("husl")
+        plt, sns = _plt, _sns
+    return plt
+
+
+def _partition_dir_name(key):
+    """
+    Имя папки отчёта для ключа разбиения (адрес магазина, район или их пара).
+    Читаемая часть теряет знаки препинания ("ул. Металлургов, 29" и "ул. Металлургов. 29"
+    дают одно и то же), поэтому к ней добавляется короткий хэш исходного ключа —
+    отчёты разных магазинов не перезаписывают друг друга.
+    """
+    parts = key if isinstance(key, tuple) else (key,)
+    name = '__'.join(re.sub(r'[^\w]+', '_', str(part)).strip('_') for part in parts)
+    digest = hashlib.sha1('\x1f'.join(map(str, parts)).encode('utf-8')).hexdigest()[:8]
+    return f"{name or 'без_названия'}_{digest}"
+
+
+def _partition_report_worker(key, data_clean, output_dir, charts):
+    """
+    Строит текстовый отчёт и графики для одного магазина/района в дочернем процессе.
+    Вывод методов менеджера подавляется, чтобы параллельные процессы не перемешивали консоль.
+    """
+    title = f"ОТЧЁТ ПО АНАЛИЗУ ПРОДАЖ И ИНВЕНТАРЯ: {' / '.join(map(str, key)) if isinstance(key, tuple) else key}"
+    os.makedirs(output_dir, exist_ok=True)
+    manager = InventoryManager()
+    manager.data_clean = data_clean
+    with contextlib.redirect_stdout(io.StringIO()):
+        save_report_to_file(build_text_report(manager, title=title),
+                            filename=os.path.join(output_dir, 'inventory_report.txt'))
+        if charts:
+            pyplot = _load_plotting(headless=True)
+            manager.create_comprehensive_report(output_dir=output_dir)
+            pyplot.close('all')
+    return key, len(data_clean), output_dir
+
 
 class InventoryManager:
     def __init__(self):
         self.data = None
         self.data_clean = None
-        # Настройка стиля графиков
-        plt.style.use('seaborn-v0_8-darkgrid')
-        sns.set_palette("husl")
+        # Сколько дубликатов удалено из каждого файла при последней загрузке
+        self.dedup_stats = {}
+        # Скетчи последней приближённой аналитики (approximate_analytics)
+        self.sales_sketch = None
+        # Необязательный SQL-бэкенд: если задан, анализы выполняются запросами к SQLite
+        self.sql_backend = None
+        # Кэш дневной свёртки; перестраивается, когда data_clean заменяются новым DataFrame
+        self._daily_rollup = None
+        self._daily_rollup_source = None
+        # Звёздная схема (факты с целочисленными ключами + измерения) для текущих data_clean
+        self._star_schema = None
+        self._star_schema_source = None
+        # Необязательный дисковый кэш результатов анализов (use_result_cache)
+        self.result_cache = None
+        # Отпечаток загруженных файлов, data и data_clean, к которым он относится
+        self._file_fingerprint = None
+        self._files_data = None
+        self._fingerprint_source = None
+        self._frame_fingerprint = None
+        # Отложенная загрузка: (files, dedup_index, deduplicate) до первого промаха кэша
+        self._deferred_load = None
 
-    def load_data(self, file_path):
+    def load_data(self, file_path, reader=None):
+        """
+        Загружает один файл в self.data. reader — функция чтения файла
+        (по умолчанию load_sales_data), например кэширующая в режиме наблюдения.
+        """
         print(f" Загрузка данных из: {file_path}")
-        self.data = load_sales_data(file_path)
+        self.data = (reader or load_sales_data)(file_path)
         if self.data is None:
             print("ЗАГРУЗКА ДАННЫХ НЕ УДАЛАСЬ")
             return False
         return True
 
+    def load_files(self, files, dedup_index=None, deduplicate=True, defer=False, reader=None):
+        """
+        Загружает и объединяет несколько CSV-файлов в self.data.
+        Отсутствующие или нечитаемые файлы пропускаются.
+        Операции, уже встречавшиеся в предыдущих файлах (по 'ID операции'
+        или по содержимому строки), отбрасываются. dedup_index — постоянный
+        индекс для дедупликации между запусками; по умолчанию индекс в памяти.
+        defer=True (при включённом кэше результатов) только запоминает файлы
+        и их отпечаток: строки читаются при первом промахе кэша.
+        reader передаётся в load_data.
+        Возвращает True, если загружен хотя бы один файл.
+        """
+        # Загрузка через переданный индекс (ingest_to_history) даёт только новые для него
+        # операции — её результаты не должны совпадать по ключу кэша с полной загрузкой
+        options = {'deduplicate': deduplicate}
+        if deduplicate and dedup_index is not None:
+            options['dedup_index'] = dedup_index.state()
+        self._file_fingerprint = fingerprint_files(
+            [file for file in files if os.path.exists(file)], **options)
+        if defer and self.result_cache is not None:
+            if not any(os.path.exists(file) for file in files):
+                print(" НИ ОДИН ФАЙЛ НЕ БЫЛ ЗАГРУЖЕН.")
+                return False
+            self._deferred_load = (list(files), dedup_index, deduplicate)
+            self.dedup_stats = self._cached_dedup_stats()
+            print(f" Загрузка {len(files)} файлов отложена до первого промаха кэша.")
+            return True
+        self._deferred_load = None
+
+        if deduplicate and dedup_index is None:
+            dedup_index = DeduplicationIndex()
+        self.dedup_stats = {}
+
+        all_data = []
+        for file in files:
+            if os.path.exists(file):
+                if self.load_data(file, reader=reader):
+                    if deduplicate:
+                        self.data = dedup_index.filter(self.data, source=file)
+                        self.dedup_stats[file] = dedup_index.removed_by_source.get(file, 0)
+                        DUPLICATES_REMOVED.inc(self.dedup_stats[file])
+                        if self.dedup_stats[file]:
+                            print(f" Из файла {file} удалено дубликатов: {self.dedup_stats[file]}")
+                    all_data.append(self.data)
+                    print(f" Файл {file} успешно загружен.")
+            else:
+                print(f"Файл {file} не найден. Пропущен.")
+
+        if not all_data:
+            self.data = None
+            print(" НИ ОДИН ФАЙЛ НЕ БЫЛ ЗАГРУЖЕН.")
+            return False
+
+        # Объединяем данные
+        self.data = pd.concat(all_data, ignore_index=True)
+        self._files_data = self.data
+        print(f" Объединено {len(self.data)} строк из {len(all_data)} файлов.")
+        return True
+
     def preprocess(self):
+        if self._deferred_load is not None:
+            print("Предобработка отложена вместе с загрузкой.")
+            return True
         if self.data is None:
             print("НЕТ ДАННЫХ ДЛЯ ПЕРЕРАБОТКИ. СНАЧАЛА ЗАГРУЗИТЕ ФАЙЛ.")
             return False
@@ -42,51 +208,335 @@ class InventoryManager:
         if self.data_clean is None:
             print("ПЕРЕРАБОТКА НЕ УДАЛАСЬ.")
             return False
+        # Если data получены из load_files, ключом кэша служит отпечаток файлов
+        self._fingerprint_source = self.data_clean if self.data is self._files_data else None
+        self._cache_put('dedup_stats', pd.DataFrame(
+            {'Файл': list(self.dedup_stats), 'Удалено дубликатов': list(self.dedup_stats.values())}))
+        self._cache_put('processed_rows', pd.DataFrame({'Строк': [len(self.data_clean)]}))
         print(f"Предобработка завершена. Обработано {len(self.data_clean)} строк.")
         return True
 
-    def analyze_revenue(self, period='D'):
+    def use_result_cache(self, cache_dir='.analysis_cache', max_bytes=256 * 1024 * 1024):
+        """
+        Включает дисковый кэш результатов: повторный запуск на тех же данных
+        с теми же параметрами возвращает таблицы из кэша без пересчёта.
+        """
+        self.result_cache = ResultCache(cache_dir, max_bytes=max_bytes)
+        print(f" Кэш результатов: {cache_dir} (до {max_bytes // (1024 * 1024)} МБ)")
+        return True
+
+    def data_fingerprint(self):
+        """
+        Отпечаток текущих данных: отпечаток файлов, если data_clean получены
+        из них (или загрузка отложена), иначе хэш содержимого data_clean.
+        """
+        if self._deferred_load is not None or (
+                self.data_clean is not None and self.data_clean is self._fingerprint_source):
+            return self._file_fingerprint
         if self.data_clean is None:
+            return None
+        if self._frame_fingerprint is None or self._frame_fingerprint[0] is not self.data_clean:
+            self._frame_fingerprint = (self.data_clean, fingerprint_frame(self.data_clean))
+        return self._frame_fingerprint[1]
+
+    def _cache_get(self, name, **params):
+        if self.result_cache is None or self.sql_backend is not None:
+            return None
+        fingerprint = self.data_fingerprint()
+        if fingerprint is None:
+            return None
+        return self.result_cache.get(fingerprint, name, **params)
+
+    def _cache_put(self, name, result, **params):
+        if self.result_cache is None or self.sql_backend is not None or result is None:
+            return result
+        fingerprint = self.data_fingerprint()
+        if fingerprint is None:
+            return result
+        return self.result_cache.put(fingerprint, name, result, **params)
+
+    def _cached_dedup_stats(self):
+        stats = self._cache_get('dedup_stats')
+        if stats is None:
+            return {}
+        return dict(zip(stats['Файл'], stats['Удалено дубликатов'].astype(int)))
+
+    def _ensure_data(self):
+        """Выполняет отложенную загрузку и предобработку (промах кэша). True, если data_clean есть."""
+        if self._deferred_load is not None:
+            files, dedup_index, deduplicate = self._deferred_load
+            print(" Кэш не содержит результата — загрузка исходных файлов...")
+            if not self.load_files(files, dedup_index=dedup_index, deduplicate=deduplicate):
+                return False
+            if not self.preprocess():
+                return False
+        return self.data_clean is not None
+
+    def _has_data(self):
+        """Есть ли источник данных для анализа (data_clean, SQL-бэкенд или отложенная загрузка)."""
+        return (self.data_clean is not None or self.sql_backend is not None
+                or self._deferred_load is not None)
+
+    def processed_rows(self):
+        """Число строк после предобработки (из кэша, если загрузка отложена)."""
+        if self._deferred_load is not None:
+            cached = self._cache_get('processed_rows')
+            if cached is not None:
+                return int(cached['Строк'].iloc[0])
+        if not self._ensure_data():
+            return 0
+        return len(self.data_clean)
+
+    def save_history(self, store_path):
+        """
+        Дописывает очищенные данные в колоночное хранилище истории
+        (по новому сегменту на каждый день).
+        """
+        if not self._ensure_data():
+            print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ ДЛЯ СОХРАНЕНИЯ.")
+            return False
+        written = HistoryStore(store_path).append(self.data_clean)
+        print(f" В хранилище {store_path} записано сегментов: {written}")
+        return written > 0
+
+    def ingest_to_history(self, files, store_path):
+        """
+        Инкрементальная загрузка новых выгрузок в хранилище истории.
+        Индекс уже загруженных операций хранится рядом с хранилищем,
+        поэтому повторно присланные или пересекающиеся файлы не задваивают данные.
+        """
+        dedup_index = DeduplicationIndex(os.path.join(store_path, 'seen_operations.npy'))
+        if not self.load_files(files, dedup_index=dedup_index):
+            return False
+        if len(self.data) == 0:
+            print(" Новых операций нет — хранилище не изменено.")
+            return True
+        if not self.preprocess() or not self.save_history(store_path):
+            return False
+        # Индекс сохраняем только после успешной записи сегментов
+        dedup_index.save()
+        return True
+
+    def load_history(self, store_path, start=None, end=None, columns=None):
+        """
+        Открывает хранилище истории и берёт в data_clean только нужные
+        столбцы и даты — остальные сегменты с диска не читаются.
+        """
+        store = HistoryStore(store_path)
+        if len(store) == 0:
+            print(f"ХРАНИЛИЩЕ {store_path} ПУСТО ИЛИ НЕ НАЙДЕНО.")
+            return False
+        data = store.read(columns=columns, start=start, end=end)
+        if data is None:
+            print("ЧТЕНИЕ ХРАНИЛИЩА НЕ УДАЛОСЬ.")
+            return False
+        self.data_clean = data
+        print(f" Из хранилища {store_path} загружено {len(data)} строк.")
+        return True
+
+    def use_sqlite_backend(self, db_path=':memory:', ingest=True):
+        """
+        Переключает анализы на SQLite-бэкенд.
+        ingest=True загружает в базу текущие data_clean; ingest=False
+        открывает уже заполненную базу (data_clean в памяти не нужны).
+        """
+        backend = SQLiteBackend(db_path)
+        if ingest:
+            if not self._ensure_data():
+                print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ ДЛЯ ЗАГРУЗКИ В SQLITE.")
+                backend.close()
+                return False
+            if not backend.ingest(self.data_clean):
+                print("ЗАГРУЗКА ДАННЫХ В SQLITE НЕ УДАЛАСЬ.")
+                backend.close()
+                return False
+        self.sql_backend = backend
+        print(f" Анализы выполняются через SQLite: {db_path}")
+        return True
+
+    def get_daily_rollup(self):
+        """
+        Дневная свёртка по типам операций, построенная один раз для текущих data_clean.
+        Все периоды (W, M, Q, Y, финансовые) считаются из неё за O(дней), а не O(строк).
+        """
+        if not self._ensure_data():
+            return None
+        if self._daily_rollup_source is not self.data_clean:
+            self._daily_rollup = build_daily_rollup(self.data_clean)
+            self._daily_rollup_source = self.data_clean
+        return self._daily_rollup
+
+    def get_star_schema(self):
+        """
+        Звёздная схема текущих data_clean: узкая таблица фактов с ключами товаров
+        и магазинов плюс измерения. Строится один раз; товарные анализы группируют
+        по целочисленному ключу и подставляют названия только в итоговые строки.
+        Схема хранится вместе с data_clean (по ним считаются периоды, отделы и ABC/XYZ),
+        поэтому память не уменьшается, а растёт на размер таблицы фактов.
+        """
+        if not self._ensure_data():
+            return None
+        if self._star_schema_source is not self.data_clean:
+            self._star_schema = build_star_schema(self.data_clean)
+            self._star_schema_source = self.data_clean
+        return self._star_schema
+
+    @ANALYSIS_SECONDS.time(analysis='revenue')
+    def analyze_revenue(self, period='D'):
+        if self.sql_backend is not None:
+            return self.sql_backend.revenue_by_period(period)
+        cached = self._cache_get('revenue_by_period', period=period)
+        if cached is not None:
+            return cached
+        if not self._ensure_data():
             print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ. Вызовите .preprocess() сначала.")
             return None
         print(f" Расчёт выручки по периоду: {period}")
-        return calculate_revenue_by_period(self.data_clean, period)
+        return self._cache_put('revenue_by_period', calculate_revenue_by_period(
+            self.data_clean, period, daily_rollup=self.get_daily_rollup()), period=period)
 
+    @ANALYSIS_SECONDS.time(analysis='profit')
     def analyze_profit(self, period='D'):
-        if self.data_clean is None:
+        if self.sql_backend is not None:
+            return self.sql_backend.profit_by_period(period)
+        cached = self._cache_get('profit_by_period', period=period)
+        if cached is not None:
+            return cached
+        if not self._ensure_data():
             print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
             return None
         print(f"Расчёт прибыли по периоду: {period}")
-        return calculate_profit_by_period(self.data_clean, period)
+        return self._cache_put('profit_by_period', calculate_profit_by_period(
+            self.data_clean, period, daily_rollup=self.get_daily_rollup()), period=period)
+
+    @ANALYSIS_SECONDS.time(analysis='margin')
+    def analyze_margin(self, period='D', by=None):
+        """
+        Валовая прибыль: каждая продажа сопоставляется с ценой последнего поступления
+        того же товара в тот же магазин. by: None, 'sku', 'department' или 'store'.
+        """
+        cached = self._cache_get('gross_margin', period=period, by=by)
+        if cached is not None:
+            return cached
+        if not self._ensure_data():
+            print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
+            return None
+        print(f"Расчёт валовой прибыли по периоду: {period}" + (f" ({by})" if by else ""))
+        return self._cache_put('gross_margin', calculate_gross_margin(
+            self.data_clean, period, by=by, star_schema=self.get_star_schema()), period=period, by=by)
 
+    @ANALYSIS_SECONDS.time(analysis='categories')
     def analyze_by_category(self):
-        if self.data_clean is None:
+        if self.sql_backend is not None:
+            return self.sql_backend.sales_by_category()
+        cached = self._cache_get('sales_by_category')
+        if cached is not None:
+            return cached
+        if not self._ensure_data():
             print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
             return None
         print("Анализ продаж по отделам...")
-        return aggregate_sales_by_category(self.data_clean)
+        return self._cache_put('sales_by_category', aggregate_sales_by_category(self.data_clean))
 
+    @ANALYSIS_SECONDS.time(analysis='top_products')
     def top_products(self, n=5, metric='quantity'):
-        if self.data_clean is None:
+        if self.sql_backend is not None:
+            return self.sql_backend.top_n_products(n, metric)
+        cached = self._cache_get('top_n_products', n=n, metric=metric)
+        if cached is not None:
+            return cached
+        if not self._ensure_data():
             print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
             return None
         print(f"Топ-{n} товаров по {metric}...")
-        return get_top_n_products(self.data_clean, n, metric)
+        return self._cache_put('top_n_products', get_top_n_products(
+            self.data_clean, n, metric, star_schema=self.get_star_schema()),
+                               n=n, metric=metric)
 
+    @ANALYSIS_SECONDS.time(analysis='turnover')
     def inventory_turnover(self, top_n=10):
-        if self.data_clean is None:
+        if self.sql_backend is not None:
+            return self.sql_backend.inventory_turnover(top_n)
+        cached = self._cache_get('inventory_turnover', top_n=top_n)
+        if cached is not None:
+            return cached
+        if not self._ensure_data():
             print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
             return None
         print(f"Анализ оборачиваемости товаров (топ-{top_n})...")
-        return analyze_inventory_turnover(self.data_clean, top_n)
+        return self._cache_put('inventory_turnover', analyze_inventory_turnover(
+            self.data_clean, top_n, star_schema=self.get_star_schema()),
+                               top_n=top_n)
+
+    @ANALYSIS_SECONDS.time(analysis='anomalies')
+    def find_anomalies(self, by='store', metric='revenue', window=28, threshold=3.5):
+        """
+        Ранжированная таблица аномальных дней (всплески, провалы,
+        поступления без продаж) по магазинам, товарам или парам магазин-товар.
+        """
+        params = dict(by=by, metric=metric, window=window, threshold=threshold)
+        cached = self._cache_get('anomalies', **params)
+        if cached is not None:
+            return cached
+        if not self._ensure_data():
+            print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
+            return None
+        print(f"Поиск аномалий ({by}, {metric}, окно {window} дн.)...")
+        return self._cache_put('anomalies', detect_anomalies(self.data_clean, **params), **params)
+
+    @ANALYSIS_SECONDS.time(analysis='stock_simulation')
+    def simulate_stock_policy(self, settings=((7, 0),), n_scenarios=1000, horizon_days=90,
+                              order_days=14, max_workers=None, seed=None):
+        """
+        Монте-Карло оценка параметров точки заказа до их изменения:
+        для каждой пары (срок поставки, страховой запас) из settings — уровень
+        сервиса, риск дефицита, средний запас, оборачиваемость и затраты на хранение
+        по каждому товару. max_workers > 1 — блоки товаров в пуле процессов.
+        """
+        if not self._ensure_data():
+            print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
+            return None
+        print(f"Симуляция запасов: {len(settings)} вариантов, {n_scenarios} сценариев, "
+              f"горизонт {horizon_days} дн....")
+        return simulate_reorder_settings(self.get_star_schema(), settings=settings,
+                                         n_scenarios=n_scenarios, horizon_days=horizon_days,
+                                         order_days=order_days, max_workers=max_workers, seed=seed)
+
+    def approximate_analytics(self, files, chunksize=100_000):
+        """
+        Приближённая аналитика по потоку файлов с фиксированной памятью:
+        файлы читаются по частям и сворачиваются в скетчи, data_clean не нужны.
+        Возвращает SalesSketch (distinct_skus_by_department, top_products, price_quantiles).
+        """
+        print(f"Приближённая аналитика по {len(files)} файлам (порции по {chunksize} строк)...")
+        self.sales_sketch = sketch_sales_files(files, chunksize=chunksize)
+        return self.sales_sketch
+
+    @ANALYSIS_SECONDS.time(analysis='abc_xyz')
+    def abc_xyz_classification(self, by_store=False):
+        """
+        ABC/XYZ-классификация всех товаров (или пар товар-магазин при by_store=True).
+        """
+        cached = self._cache_get('abc_xyz', by_store=by_store)
+        if cached is not None:
+            return cached
+        if not self._ensure_data():
+            print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
+            return None
+        print("ABC/XYZ-классификация ассортимента" + (" по магазинам..." if by_store else "..."))
+        return self._cache_put('abc_xyz', classify_abc_xyz(self.data_clean, by_store=by_store),
+                               by_store=by_store)
 
     # --- МЕТОДЫ ВИЗУАЛИЗАЦИИ ---
     
-    def plot_revenue_trend(self, period='D', save_path=None):
+    def plot_revenue_trend(self, period='D', save_path=None, max_points=1000):
         """
         Визуализация тренда выручки по времени.
+        Если периодов больше max_points, линия рисуется по max_points точкам,
+        выбранным LTTB (форма ряда сохраняется), без маркеров.
         """
-        if self.data_clean is None:
+        _load_plotting()
+        if not self._has_data():
             print("НЕТ ДАННЫХ ДЛЯ ВИЗУАЛИЗАЦИИ.")
             return None
         
@@ -98,11 +548,14 @@ class InventoryManager:
         plt.figure(figsize=(14, 6))
         
         # Определяем название периода для заголовка
-        period_names = {'D': 'дням', 'W': 'неделям', 'M': 'месяцам'}
-        period_name = period_names.get(period, 'дням')
-        
-        plt.plot(revenue_data['Дата'], revenue_data['Выручка'] / 1_000_000, 
-                marker='o', linewidth=2, markersize=6)
+        period_name = PERIOD_NAMES.get(period.split('-')[0], 'периодам')
+        
+        plot_data = revenue_data
+        downsampled = max_points is not None and len(revenue_data) > max_points
+        if downsampled:
+            plot_data = revenue_data.iloc[lttb(revenue_data['Дата'], revenue_data['Выручка'], max_points)]
+        plt.plot(plot_data['Дата'], plot_data['Выручка'] / 1_000_000, 
+                marker=None if downsampled else 'o', linewidth=1 if downsampled else 2, markersize=6)
         plt.title(f'Тренд выручки по {period_name}', fontsize=16, fontweight='bold')
         plt.xlabel('Дата', fontsize=12)
         plt.ylabel('Выручка (млн руб.)', fontsize=12)
@@ -117,11 +570,15 @@ class InventoryManager:
         plt.show()
         return revenue_data
     
-    def plot_profit_trend(self, period='D', save_path=None):
+    def plot_profit_trend(self, period='D', save_path=None, max_points=400, label_top_k=10):
         """
         Визуализация тренда прибыли по времени.
+        Если периодов больше max_points, рисуются только минимум и максимум каждого
+        из max_points/2 интервалов (огибающая) тонкими линиями вместо столбцов.
+        Подписываются label_top_k наибольших по модулю значений.
         """
-        if self.data_clean is None:
+        _load_plotting()
+        if not self._has_data():
             print("НЕТ ДАННЫХ ДЛЯ ВИЗУАЛИЗАЦИИ.")
             return None
         
@@ -132,12 +589,19 @@ class InventoryManager:
         
         plt.figure(figsize=(14, 6))
         
-        period_names = {'D': 'дням', 'W': 'неделям', 'M': 'месяцам'}
-        period_name = period_names.get(period, 'дням')
-        
-        colors = ['green' if p >= 0 else 'red' for p in profit_data['Прибыль']]
-        bars = plt.bar(profit_data['Дата'], profit_data['Прибыль'] / 1_000_000, 
-                      color=colors, alpha=0.7)
+        period_name = PERIOD_NAMES.get(period.split('-')[0], 'периодам')
+        
+        plot_data = profit_data
+        downsampled = max_points is not None and len(profit_data) > max_points
+        if downsampled:
+            plot_data = profit_data.iloc[minmax_indices(profit_data['Прибыль'], max_points // 2)]
+        dates = plot_data['Дата'].to_numpy()
+        heights = plot_data['Прибыль'].to_numpy() / 1_000_000
+        colors = np.where(heights >= 0, 'green', 'red')
+        if downsampled:
+            plt.vlines(dates, 0, heights, colors=colors, alpha=0.7, linewidth=1)
+        else:
+            plt.bar(dates, heights, color=colors, alpha=0.7)
         
         plt.title(f'Прибыль по {period_name}', fontsize=16, fontweight='bold')
         plt.xlabel('Дата', fontsize=12)
@@ -145,13 +609,12 @@ class InventoryManager:
         plt.xticks(rotation=45)
         plt.grid(True, alpha=0.3, axis='y')
         
-        # Добавляем подписи значений
-        for bar in bars:
-            height = bar.get_height()
-            if abs(height) > 0.1:  # Показываем только значительные значения
-                plt.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{height:.1f}', ha='center', va='bottom' if height >= 0 else 'top',
-                        fontsize=9)
+        # Подписи только для top-k значений по модулю (и только значительных)
+        labeled = top_k_indices(heights, label_top_k)
+        labeled = labeled[np.abs(heights[labeled]) > 0.1]
+        for date, height in zip(dates[labeled], heights[labeled]):
+            plt.text(date, height, f'{height:.1f}', ha='center',
+                     va='bottom' if height >= 0 else 'top', fontsize=9)
         
         plt.tight_layout()
         
@@ -166,7 +629,8 @@ class InventoryManager:
         """
         Визуализация продаж по категориям.
         """
-        if self.data_clean is None:
+        _load_plotting()
+        if not self._has_data():
             print("НЕТ ДАННЫХ ДЛЯ ВИЗУАЛИЗАЦИИ.")
             return None
         
@@ -212,7 +676,8 @@ class InventoryManager:
         """
         Визуализация топ-N товаров.
         """
-        if self.data_clean is None:
+        _load_plotting()
+        if not self._has_data():
             print("НЕТ ДАННЫХ ДЛЯ ВИЗУАЛИЗАЦИИ.")
             return None
         
@@ -265,7 +730,8 @@ class InventoryManager:
         """
         Визуализация анализа оборачиваемости товаров.
         """
-        if self.data_clean is None:
+        _load_plotting()
+        if not self._has_data():
             print("НЕТ ДАННЫХ ДЛЯ ВИЗУАЛИЗАЦИИ.")
             return None
         
@@ -327,7 +793,7 @@ class InventoryManager:
         """
         Создает комплексный отчет со всеми визуализациями.
         """
-        import os
+        _load_plotting()
         os.makedirs(output_dir, exist_ok=True)
         
         print(f"\n{'='*60}")
@@ -365,7 +831,65 @@ class InventoryManager:
         print(f"\n Все графики сохранены в папке: {output_dir}/")
         print("Визуализация завершена!")
 
-    def get_slow_moving_items_report(self, days_back=90, sales_threshold=5):
+    def export_tables(self, output_dir='exports', formats=('parquet', 'csv'), chunksize=100_000):
+        """
+        Выгружает полные таблицы всех анализов (а не первые строки, как в текстовом
+        отчёте) в Parquet/Feather/CSV/JSON Lines. Таблицы пишутся по одной порциями.
+        """
+        if not self._has_data():
+            print("НЕТ ДАННЫХ ДЛЯ ВЫГРУЗКИ.")
+            return None
+        print(f"Выгрузка полных таблиц в {output_dir}/ ({', '.join(formats)})...")
+        manifest = export_results(self, output_dir=output_dir, formats=formats, chunksize=chunksize)
+        if manifest is not None:
+            print(f" Выгружено файлов: {len(manifest)}")
+        return manifest
+
+    def generate_partition_reports(self, by='Адрес магазина', output_dir='store_reports',
+                                   charts=True, max_workers=None):
+        """
+        Пакетный режим: текстовый отчёт и графики для каждого магазина и/или района.
+        Данные загружаются и предобрабатываются один раз; разбиение по by
+        ('Адрес магазина', 'Район магазина' или список из обоих) обрабатывается
+        в пуле процессов, по папке на каждую часть внутри output_dir.
+        Возвращает DataFrame со сводкой: ключ, число строк, папка, статус.
+        """
+        if not self._ensure_data():
+            print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
+            return None
+        keys = [by] if isinstance(by, str) else list(by)
+        missing = [key for key in keys if key not in self.data_clean.columns]
+        if missing:
+            print(f"В ДАННЫХ НЕТ СТОЛБЦОВ ДЛЯ РАЗБИЕНИЯ: {missing}")
+            return None
+
+        partitions = list(self.data_clean.groupby(keys[0] if len(keys) == 1 else keys, sort=True))
+        print(f"Пакетная генерация отчётов: {len(partitions)} частей по {keys}, "
+              f"процессов: {max_workers or os.cpu_count()}...")
+
+        summary = []
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(_partition_report_worker, key,
+                            part.reset_index(drop=True),
+                            os.path.join(output_dir, _partition_dir_name(key)), charts): key
+                for key, part in partitions
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    _, rows, path = future.result()
+                    summary.append({'Часть': key, 'Строк': rows, 'Папка': path, 'Статус': 'готово'})
+                    print(f" Отчёт готов: {key} -> {path}")
+                except Exception as e:
+                    summary.append({'Часть': key, 'Строк': 0, 'Папка': None, 'Статус': f'ошибка: {e}'})
+                    print(f"ОШИБКА ПРИ ФОРМИРОВАНИИ ОТЧЁТА ДЛЯ {key}: {e}")
+
+        print(f"\n Пакетные отчёты сохранены в папке: {output_dir}/")
+        return pd.DataFrame(summary).sort_values('Часть', key=lambda s: s.astype(str)).reset_index(drop=True)
+
+    @ANALYSIS_SECONDS.time(analysis='slow_moving')
+    def get_slow_moving_items_report(self, days_back=90, sales_threshold=5, as_of=None):
         """
     Возвращает отчет о товарах, которые "застоялись" на складе.
     Этот отчет важен для для закупщиков и менеджеров склада.
@@ -374,17 +898,33 @@ class InventoryManager:
     - Освободить складские площади
     - Снизить издержки на хранение
         """
-        return identify_slow_moving_items(
+        if self.sql_backend is not None:
+            return self.sql_backend.slow_moving_items(days_back, sales_threshold, as_of=as_of)
+        if as_of is None:
+            # Отчёт на начало текущих суток — как в identify_slow_moving_items; с кэшем
+            # и без него результат один и тот же, повторные запуски за день находят запись
+            as_of = pd.Timestamp.now().normalize()
+        params = dict(days_back=days_back, sales_threshold=sales_threshold, as_of=as_of)
+        cached = self._cache_get('slow_moving_items', **params)
+        if cached is not None:
+            return cached
+        if not self._ensure_data():
+            print("НЕТ ПЕРЕРАБОТАННЫХ ДАННЫХ.")
+            return None
+        return self._cache_put('slow_moving_items', identify_slow_moving_items(
             self.data_clean, 
             days_back=days_back, 
-            sales_threshold=sales_threshold
-        )
+            sales_threshold=sales_threshold,
+            as_of=as_of,
+            star_schema=self.get_star_schema()
+        ), **params)
     
     def plot_slow_moving_items(self, slow_moving, save_path=None):
         """
         Визуализирует медленно движущиеся товары: горизонтальный бар-чарт.
         Продажи за 90 дней vs текущий остаток.
         """
+        _load_plotting()
         if slow_moving.empty:
             print(" Нет данных для визуализации медленно движущихся товаров.")
             return None
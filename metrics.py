@@ -0,0 +1,252 @@
+"""
+Метрики конвейера в текстовом формате Prometheus.
+
+Счётчики, датчики и гистограммы без внешних зависимостей. Все метрики
+приложения объявлены ниже и регистрируются в REGISTRY; process.py,
+result_cache.py и InventoryManager обновляют их по ходу работы.
+Снять значения можно двумя способами:
+    write_textfile('/var/lib/node_exporter/inventory.prom')  # для textfile collector
+    start_http_server(9108)                                  # GET /metrics
+Обновление метрики — одна операция под блокировкой, поэтому накладные
+расходы несопоставимо малы по сравнению с загрузкой и анализом данных.
+"""
+import contextlib
+import logging
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм длительности, сек.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class _Timer(contextlib.ContextDecorator):
+    """Замер длительности блока или функции в гистограмму."""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._started, **self.labels)
+        return False
+
+    def _recreate_cm(self):
+        # Новый экземпляр на каждый вызов декорированной функции (потоки, рекурсия)
+        return _Timer(self.histogram, self.labels)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Метрика без меток видна (со значением 0) ещё до первого события
+            self._values[()] = self._initial()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _initial(self):
+        return 0
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def collect(self):
+        """Строки экспозиции Prometheus для метрики."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Счётчик не может уменьшаться")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Произвольное текущее значение (время последнего запуска, статус)."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами (длительности этапов)."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _initial(self):
+        return [[0] * len(self.buckets), 0.0, 0]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = self._initial()
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Контекстный менеджер и декоратор: замеряет длительность в секундах."""
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = key + (('le', _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик, выводимых вместе."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- Метрики приложения ---
+RUN_SECONDS = Histogram('inventory_run_duration_seconds',
+                        'Длительность полного запуска анализа')
+LAST_RUN_TIMESTAMP = Gauge('inventory_last_run_timestamp_seconds',
+                           'Время окончания последнего запуска (unix time)')
+LAST_RUN_SUCCESS = Gauge('inventory_last_run_success',
+                         '1, если последний запуск завершился успешно, иначе 0')
+ROWS_LOADED = Counter('inventory_rows_loaded_total',
+                      'Строк прочитано из исходных файлов (load_sales_data)')
+FILES_LOADED = Counter('inventory_files_loaded_total',
+                       'Результаты чтения исходных файлов', ['result'])
+LOAD_SECONDS = Histogram('inventory_load_duration_seconds',
+                         'Длительность чтения одного файла (load_sales_data)')
+ROWS_DROPPED = Counter('inventory_rows_dropped_total',
+                       'Строк отброшено при предобработке', ['reason'])
+ROWS_PREPROCESSED = Counter('inventory_rows_preprocessed_total',
+                            'Строк осталось после предобработки (preprocess_data)')
+PREPROCESS_SECONDS = Histogram('inventory_preprocess_duration_seconds',
+                               'Длительность предобработки (preprocess_data)')
+DUPLICATES_REMOVED = Counter('inventory_duplicates_removed_total',
+                             'Дублирующихся операций отброшено при загрузке')
+ANALYSIS_SECONDS = Histogram('inventory_analysis_duration_seconds',
+                             'Длительность анализа InventoryManager (с учётом кэша)', ['analysis'])
+CACHE_REQUESTS = Counter('inventory_cache_requests_total',
+                         'Обращения к дисковому кэшу результатов', ['result'])
+
+
+def write_textfile(path, registry=None):
+    """Атомарно записывает метрики в файл (для node_exporter textfile collector)."""
+    registry = REGISTRY if registry is None else registry
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(registry.render())
+        os.replace(tmp_path, path)
+        logger.info(f"Метрики записаны: {path}")
+        return True
+    except Exception as e:
+        logger.error(f"ОШИБКА ПРИ ЗАПИСИ МЕТРИК В {path}: {e}")
+        return False
+
+
+def start_http_server(port=9108, host='127.0.0.1', registry=None):
+    """Отдаёт метрики по GET /metrics в фоновом потоке. Возвращает сервер."""
+    registry = REGISTRY if registry is None else registry
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Метрики доступны: http://{host}:{server.server_port}/metrics")
+    return server
@@ -1,7 +1,16 @@
 import pandas as pd
 import numpy as np
+from collections import namedtuple
 from datetime import datetime
 import logging
+from metrics import (
+    FILES_LOADED,
+    LOAD_SECONDS,
+    PREPROCESS_SECONDS,
+    ROWS_DROPPED,
+    ROWS_LOADED,
+    ROWS_PREPROCESSED
+)
 """
 Задаем настройки логирования, необходимые для отслеживания работы программы 
 и быстрого определения где программа "сломалась", в случае если это произошло
@@ -9,6 +18,12 @@ import logging
 logging.basicConfig(level=logging.INFO) # Базовая конфигурация логирования, задающая минимальный уровень важности сообщений
 logger = logging.getLogger(__name__)
 
+# Звёздная схема: узкая таблица фактов с целочисленными ключами и таблицы-измерения
+StarSchema = namedtuple('StarSchema', ['fact', 'products', 'stores'])
+
+PRODUCT_KEYS = ['Артикул', 'Название товара']
+
+@LOAD_SECONDS.time()
 def load_sales_data(file_path):
     """
     Загружает данные из CSV-файла.
@@ -30,48 +45,89 @@ def load_sales_data(file_path):
                 except:
                     df = pd.read_csv(file_path, sep=',', encoding='cp1251')
                     logger.info(f"Успешно загружено с CP1251 и разделителем ','")
-          # Удаляем столбцы 'Unnamed:' если они есть
-        unnamed_cols = [col for col in df.columns if 'Unnamed' in col]
-        if unnamed_cols:
-            df = df.drop(columns=unnamed_cols)
-            logger.info(f"Удалены лишние столбцы: {unnamed_cols}")
-
-        # Логируем доступные столбцы
-        logger.info(f"Доступные столбцы: {list(df.columns)}")
-        
-        # Создаем словарь для переименования столбцов
-        rename_dict = {}
-        
-        # Проверяем и переименовываем столбцы
-        # Количество упаковок, шт. -> Количество упаковок
-        if 'Количество упаковок, шт' in df.columns and 'Количество упаковок, шт.' not in df.columns:
-            rename_dict['Количество упаковок, шт'] = 'Количество упаковок, шт.'
-        # Операция -> Тип операции
-        if 'Операция' in df.columns and 'Тип операции' not in df.columns:
-            rename_dict['Операция'] = 'Тип операции'
-        # Цена руб/шт -> Цена руб./шт.
-        if 'Цена руб/шт' in df.columns and 'Цена руб./шт.' not in df.columns:
-            rename_dict['Цена руб/шт'] = 'Цена руб./шт.'
-
-        # Применяем переименование
-        if rename_dict:
-            df = df.rename(columns=rename_dict)
-            logger.info(f"Переименованы столбцы: {rename_dict}")
-        
-        # Проверяем наличие всех необходимых столбцов после переименования
-        required_columns = ['Дата', 'Артикул', 'Отдел товара', 'Количество упаковок, шт.', 
-                          'Тип операции', 'Цена руб./шт.']
-        missing_cols = [col for col in required_columns if col not in df.columns]
-        if missing_cols:
-            logger.error(f"ОТСУТСТВУЮТ ОБЯЗАТЕЛЬНЫЕ СТОЛБЦЫ: {missing_cols}")
-            logger.info(f"Доступные столбцы после переименования: {list(df.columns)}")
+        df = normalize_columns(df)
+        if df is None:
+            FILES_LOADED.inc(result='invalid')
             return None
         logger.info(f"Успешно загружено {len(df)} строк из {file_path}")
+        FILES_LOADED.inc(result='ok')
+        ROWS_LOADED.inc(len(df))
         return df
     except Exception as e:
+        FILES_LOADED.inc(result='error')
         logger.error(f"НЕ УДАЛОСЬ ЗАГРУЗИТЬ ФАЙЛ {file_path}: {e}")
         return None
 
+def normalize_columns(df):
+    """
+    Приводит названия столбцов к единому виду: удаляет пустые столбцы 'Unnamed:',
+    переименовывает известные варианты написания и проверяет обязательные столбцы.
+    Возвращает DataFrame или None, если обязательных столбцов не хватает.
+    """
+    # Удаляем столбцы 'Unnamed:' если они есть
+    unnamed_cols = [col for col in df.columns if 'Unnamed' in col]
+    if unnamed_cols:
+        df = df.drop(columns=unnamed_cols)
+        logger.info(f"Удалены лишние столбцы: {unnamed_cols}")
+
+    # Логируем доступные столбцы
+    logger.info(f"Доступные столбцы: {list(df.columns)}")
+    
+    # Создаем словарь для переименования столбцов
+    rename_dict = {}
+    
+    # Проверяем и переименовываем столбцы
+    # Количество упаковок, шт. -> Количество упаковок
+    if 'Количество упаковок, шт' in df.columns and 'Количество упаковок, шт.' not in df.columns:
+        rename_dict['Количество упаковок, шт'] = 'Количество упаковок, шт.'
+    # Операция -> Тип операции
+    if 'Операция' in df.columns and 'Тип операции' not in df.columns:
+        rename_dict['Операция'] = 'Тип операции'
+    # Цена руб/шт -> Цена руб./шт.
+    if 'Цена руб/шт' in df.columns and 'Цена руб./шт.' not in df.columns:
+        rename_dict['Цена руб/шт'] = 'Цена руб./шт.'
+
+    # Применяем переименование
+    if rename_dict:
+        df = df.rename(columns=rename_dict)
+        logger.info(f"Переименованы столбцы: {rename_dict}")
+    
+    # Проверяем наличие всех необходимых столбцов после переименования
+    required_columns = ['Дата', 'Артикул', 'Отдел товара', 'Количество упаковок, шт.', 
+                      'Тип операции', 'Цена руб./шт.']
+    missing_cols = [col for col in required_columns if col not in df.columns]
+    if missing_cols:
+        logger.error(f"ОТСУТСТВУЮТ ОБЯЗАТЕЛЬНЫЕ СТОЛБЦЫ: {missing_cols}")
+        logger.info(f"Доступные столбцы после переименования: {list(df.columns)}")
+        return None
+    return df
+
+def iter_sales_chunks(file_path, chunksize=100_000):
+    """
+    Читает CSV-файл по частям (chunksize строк), не загружая его целиком.
+    Кодировка и разделитель подбираются так же, как в load_sales_data.
+    Генерирует сырые DataFrame с нормализованными столбцами.
+    """
+    for sep, encoding in [(';', 'utf-8'), (',', 'utf-8'), (';', 'cp1251'), (',', 'cp1251')]:
+        try:
+            reader = pd.read_csv(file_path, sep=sep, encoding=encoding, chunksize=chunksize)
+            first_chunk = normalize_columns(next(reader))
+        except StopIteration:
+            return
+        except Exception:
+            continue
+        if first_chunk is None:
+            continue
+        logger.info(f"Потоковое чтение {file_path}: кодировка {encoding}, разделитель '{sep}'")
+        yield first_chunk
+        for chunk in reader:
+            chunk = normalize_columns(chunk)
+            if chunk is not None:
+                yield chunk
+        return
+    logger.error(f"НЕ УДАЛОСЬ ПРОЧИТАТЬ ФАЙЛ {file_path} ПО ЧАСТЯМ")
+
+@PREPROCESS_SECONDS.time()
 def preprocess_data(data):
     """
     Предобработка данных: проверяем наши данные, убираем лишнее, приводим все к одному формату,
@@ -89,6 +145,7 @@ def preprocess_data(data):
         invalid_dates = df['Дата'].isna().sum()
         if invalid_dates > 0:
             logger.warning(f"Удалено {invalid_dates} строк с некорректными датами")
+            ROWS_DROPPED.inc(int(invalid_dates), reason='invalid_date')
             df = df.dropna(subset=['Дата'])
     except Exception as e:
         logger.error(f"ОШИБКА ПРЕОБРАЗОВАНИЯ ДАТЫ: {e}")
@@ -109,13 +166,18 @@ def preprocess_data(data):
     removed_count = initial_count - len(df)
     if removed_count > 0:
         logger.info(f"Удалено {removed_count} строк с пустыми значениями")
+        ROWS_DROPPED.inc(removed_count, reason='missing_values')
     # 4. Создание столбца "Сумма операции"
     df['Сумма операции'] = df['Количество упаковок, шт.'] * df['Цена руб./шт.']
     # 5. Проверка наличия отрицательных значений
+    before_negative = len(df)
     df = df[df['Количество упаковок, шт.'] >= 0]
     df = df[df['Цена руб./шт.'] >= 0]
+    if len(df) < before_negative:
+        ROWS_DROPPED.inc(before_negative - len(df), reason='negative_values')
 
     logger.info(f"Предобработка завершена. Осталось {len(df)} строк.")
+    ROWS_PREPROCESSED.inc(len(df))
     return df.reset_index(drop=True)
 
 def get_operational_data(data_clean, operation_type=None):
@@ -140,107 +202,339 @@ def get_operational_data(data_clean, operation_type=None):
     logger.info(f"Отфильтровано {len(filtered_data)} строк с типом операции '{operation_type}'")
     return filtered_data
 
-def calculate_revenue_by_period(data_clean, period='D'):
+def build_daily_rollup(data_clean):
     """
-    Рассчитывает общую выручку для каждого указанного временного промежутка.
+    Строит дневную свёртку: сумму и число операций по каждому дню и типу операции.
+    Из свёртки любые более крупные периоды (неделя, месяц, квартал, год,
+    финансовые периоды) получаются без повторного прохода по исходным строкам.
+    Возвращает DataFrame с индексом-датой и столбцами
+    ('Сумма операции' | 'Операций', <тип операции>) или None при ошибке.
     """
     if data_clean is None or len(data_clean) == 0:
-        logger.warning("Нет данных для расчёта выручки.")
+        logger.warning("Нет данных для построения дневной свёртки.")
         return None
-    
+
+    try:
+        days = data_clean['Дата'].dt.normalize()
+        rollup = data_clean.groupby([days, 'Тип операции'])['Сумма операции'].agg(['sum', 'count'])
+        rollup = rollup.rename(columns={'sum': 'Сумма операции', 'count': 'Операций'})
+        rollup = rollup.unstack('Тип операции', fill_value=0).sort_index()
+        logger.info(f"Дневная свёртка построена: {len(rollup)} дней.")
+        return rollup
+    except Exception as e:
+        logger.error(f"ОШИБКА ПРИ ПОСТРОЕНИИ ДНЕВНОЙ СВЁРТКИ: {e}")
+        return None
+
+def build_star_schema(data_clean):
+    """
+    Разделяет очищенные данные на звёздную схему:
+    - products: измерение товаров (Артикул, Название товара, Отдел товара), ключ — номер строки;
+    - stores: измерение магазинов (Адрес магазина, Район магазина);
+    - fact: 'Ключ товара', 'Ключ магазина' (int32), 'Дата', 'Тип операции' (category),
+      количество, цена и сумма операции.
+    Ключи товаров присвоены в порядке сортировки (Артикул, Название товара), как у groupby,
+    поэтому агрегаты по ключу идут в том же порядке, что и прежние группировки по строкам.
+    Строки с пропуском в ключе получают ключ -1 и в агрегатах не участвуют.
+    Схема ускоряет товарные агрегаты, но не заменяет data_clean: периоды, отделы и
+    ABC/XYZ по-прежнему считаются по широкой таблице, и схема занимает память сверх неё.
+    Построение стоит как несколько агрегатов, поэтому при нескольких вызовах
+    get_top_n_products / analyze_inventory_turnover / identify_slow_moving_items /
+    calculate_gross_margin схему строят один раз и передают через star_schema=.
+    Возвращает StarSchema или None при ошибке.
+    """
+    if data_clean is None or len(data_clean) == 0:
+        logger.warning("Нет данных для построения звёздной схемы.")
+        return None
+
+    try:
+        by_product = data_clean.groupby(PRODUCT_KEYS, sort=True)
+        products = by_product['Отдел товара'].first().reset_index()
+        product_key = by_product.ngroup().fillna(-1).to_numpy(dtype=np.int32)
+
+        store_columns = [c for c in ['Адрес магазина', 'Район магазина'] if c in data_clean.columns]
+        if store_columns:
+            by_store = data_clean.groupby(store_columns[0], sort=True)
+            stores = (by_store[store_columns[1:]].first().reset_index() if len(store_columns) > 1
+                      else pd.DataFrame({store_columns[0]: list(by_store.groups)}))
+            store_key = by_store.ngroup().fillna(-1).to_numpy(dtype=np.int32)
+        else:
+            stores = pd.DataFrame()
+            store_key = np.full(len(data_clean), -1, dtype=np.int32)
+
+        fact = pd.DataFrame({
+            'Ключ товара': product_key,
+            'Ключ магазина': store_key,
+            'Дата': data_clean['Дата'].to_numpy(),
+            'Тип операции': pd.Categorical(data_clean['Тип операции']),
+            'Количество упаковок, шт.': data_clean['Количество упаковок, шт.'].to_numpy(),
+            'Цена руб./шт.': data_clean['Цена руб./шт.'].to_numpy(),
+            'Сумма операции': data_clean['Сумма операции'].to_numpy(),
+        })
+        logger.info(f"Звёздная схема построена: {len(fact)} фактов, {len(products)} товаров, "
+                    f"{len(stores)} магазинов.")
+        return StarSchema(fact, products, stores)
+    except Exception as e:
+        logger.error(f"ОШИБКА ПРИ ПОСТРОЕНИИ ЗВЁЗДНОЙ СХЕМЫ: {e}")
+        return None
+
+def _sum_by_product(star_schema, mask, column):
+    """
+    Сумма column по ключу товара для строк фактов под маской mask.
+    Возвращает (суммы, есть_строки) — массивы длины числа товаров.
+    """
+    fact = star_schema.fact
+    keys = fact['Ключ товара'].to_numpy()
+    mask = mask & (keys >= 0)
+    n_products = len(star_schema.products)
+    values = fact[column].to_numpy()[mask]
+    sums = np.bincount(keys[mask], weights=values, minlength=n_products)
+    if np.issubdtype(values.dtype, np.integer):
+        sums = sums.round().astype(np.int64)
+    present = np.bincount(keys[mask], minlength=n_products) > 0
+    return sums, present
+
+def _attach_product_names(star_schema, frame, position=0):
+    """
+    Заменяет столбец 'Ключ товара' итоговой таблицы frame на Артикул и Название товара
+    из измерения товаров (вставляются на место position). Названия подставляются только
+    для итоговых строк, поэтому группировки идут по целочисленному ключу.
+    """
+    names = star_schema.products[PRODUCT_KEYS].iloc[frame['Ключ товара']].reset_index(drop=True)
+    rest = frame.drop(columns='Ключ товара').reset_index(drop=True)
+    return pd.concat([rest.iloc[:, :position], names, rest.iloc[:, position:]], axis=1)
+
+def _outer_filled(sums, present, rows):
+    """
+    Суммы по строкам rows (объединение двух сторон), как после outer merge + fillna(0):
+    при пропусках на этой стороне столбец становится float.
+    """
+    values = sums[rows]
+    if not present[rows].all():
+        values = values.astype(float)
+    return values
+
+def is_valid_period(period):
+    """Проверяет, что period — допустимая частота периода pandas ('D', 'W', 'M', 'Q-MAR', ...)."""
+    try:
+        pd.Period('2000-01-01', freq=period)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+def resample_daily_rollup(daily_rollup, period='D'):
+    """
+    Агрегирует дневную свёртку до указанного периода.
+    period — частота периода pandas: 'D', 'W', 'M', 'Q', 'Y', а также
+    финансовые периоды со сдвигом года, например 'Q-MAR' или 'Y-MAR'
+    (финансовый год, заканчивающийся в марте).
+    Индекс результата — дата начала периода.
+    """
+    if period == 'D':
+        return daily_rollup
+    periods = daily_rollup.index.to_period(period)
+    resampled = daily_rollup.groupby(periods).sum()
+    resampled.index = resampled.index.start_time
+    return resampled
+
+def calculate_revenue_by_period(data_clean, period='D', daily_rollup=None):
+    """
+    Рассчитывает общую выручку для каждого указанного временного промежутка.
+    Если передана готовая дневная свёртка (build_daily_rollup), исходные строки не читаются.
+    """
+    if daily_rollup is None:
+        if data_clean is None or len(data_clean) == 0:
+            logger.warning("Нет данных для расчёта выручки.")
+            return None
+        daily_rollup = build_daily_rollup(data_clean)
+        if daily_rollup is None:
+            return None
+
     # Используем только продажи
-    sales_data = get_operational_data(data_clean, operation_type='Продажа')
-    if sales_data is None or len(sales_data) == 0:
+    if 'Продажа' not in daily_rollup['Операций'].columns:
         logger.warning("Нет данных о продажах для расчёта выручки.")
         return None
-    
+
     try:
         # Группировка по периоду
-        sales_data = sales_data.copy()
-        sales_data['Период'] = sales_data['Дата'].dt.to_period(period)
-        revenue_data = sales_data.groupby('Период').agg({
-            'Сумма операции': 'sum'
-        }).reset_index()
-        
-        # Преобразуем период обратно в дату для начала периода
-        if period == 'D':
-            revenue_data['Дата'] = revenue_data['Период'].dt.to_timestamp()
-        elif period == 'W':
-            revenue_data['Дата'] = revenue_data['Период'].dt.start_time
-        elif period == 'M':
-            revenue_data['Дата'] = revenue_data['Период'].dt.start_time
-        
-        revenue_data = revenue_data[['Дата', 'Сумма операции']]
-        revenue_data = revenue_data.rename(columns={'Сумма операции': 'Выручка'})
-        revenue_data = revenue_data.sort_values('Дата')
-        
+        by_period = resample_daily_rollup(daily_rollup, period)
+        has_sales = by_period[('Операций', 'Продажа')] > 0
+
+        revenue_data = pd.DataFrame({
+            'Дата': by_period.index[has_sales],
+            'Выручка': by_period.loc[has_sales, ('Сумма операции', 'Продажа')].to_numpy()
+        })
+
         logger.info(f"Выручка по периоду '{period}' рассчитана. {len(revenue_data)} периодов.")
         return revenue_data.reset_index(drop=True)
-        
+
     except Exception as e:
         logger.error(f"ОШИБКА ПРИ РАСЧЁТЕ ВЫРУЧКИ ПО ПЕРИОДУ {period}: {e}")
         return None
 
-def calculate_profit_by_period(data_clean, period='D'):
+def calculate_profit_by_period(data_clean, period='D', daily_rollup=None):
     """
     Рассчитывает прибыль (доходы - расходы) в периодах.
+    Если передана готовая дневная свёртка (build_daily_rollup), исходные строки не читаются.
     """
-    if data_clean is None or len(data_clean) == 0:
-        logger.warning("Нет данных для расчёта прибыли.")
-        return None
-    
+    if daily_rollup is None:
+        if data_clean is None or len(data_clean) == 0:
+            logger.warning("Нет данных для расчёта прибыли.")
+            return None
+        daily_rollup = build_daily_rollup(data_clean)
+        if daily_rollup is None:
+            return None
+
     try:
-        # Получаем продажи и поступления
-        sales = get_operational_data(data_clean, operation_type='Продажа')
-        purchases = get_operational_data(data_clean, operation_type='Поступление')
-        
-        if sales is None or purchases is None:
+        # Нужны и продажи, и поступления
+        operations = daily_rollup['Операций'].columns
+        if 'Продажа' not in operations or 'Поступление' not in operations:
             logger.warning("Нет данных о продажах или поступлениях.")
             return None
-        
-        sales = sales.copy()
-        purchases = purchases.copy()
-        
-        # Добавляем период
-        sales['Период'] = sales['Дата'].dt.to_period(period)
-        purchases['Период'] = purchases['Дата'].dt.to_period(period)
-        
-        # Группируем продажи (доходы)
-        revenue_by_period = sales.groupby('Период').agg({
-            'Сумма операции': 'sum'
-        }).reset_index()
-        revenue_by_period = revenue_by_period.rename(columns={'Сумма операции': 'Доходы'})
-        
-        # Группируем поступления (расходы)
-        expenses_by_period = purchases.groupby('Период').agg({
-            'Сумма операции': 'sum'
-        }).reset_index()
-        expenses_by_period = expenses_by_period.rename(columns={'Сумма операции': 'Расходы'})
-        
-        # Объединяем
-        profit_data = pd.merge(revenue_by_period, expenses_by_period, on='Период', how='outer').fillna(0)
-        
+
+        by_period = resample_daily_rollup(daily_rollup, period)
+        has_operations = ((by_period[('Операций', 'Продажа')] > 0)
+                          | (by_period[('Операций', 'Поступление')] > 0))
+        by_period = by_period[has_operations]
+
         # Рассчитываем прибыль
-        profit_data['Прибыль'] = profit_data['Доходы'] - profit_data['Расходы']
-        
-        # Преобразуем период в дату
-        if period == 'D':
-            profit_data['Дата'] = profit_data['Период'].dt.to_timestamp()
-        elif period == 'W':
-            profit_data['Дата'] = profit_data['Период'].dt.start_time
-        elif period == 'M':
-            profit_data['Дата'] = profit_data['Период'].dt.start_time
-        
-        profit_data = profit_data[['Дата', 'Прибыль']]
-        profit_data = profit_data.sort_values('Дата')
-        
+        profit_data = pd.DataFrame({
+            'Дата': by_period.index,
+            'Прибыль': (by_period[('Сумма операции', 'Продажа')]
+                        - by_period[('Сумма операции', 'Поступление')]).to_numpy()
+        })
+
         logger.info(f"Прибыль по периоду '{period}' рассчитана. {len(profit_data)} периодов.")
         return profit_data.reset_index(drop=True)
-        
+
     except Exception as e:
         logger.error(f"ОШИБКА ПРИ РАСЧЁТЕ ПРИБЫЛИ ПО ПЕРИОДУ {period}: {e}")
         return None
 
+MARGIN_GROUPS = {
+    'sku': PRODUCT_KEYS,
+    'department': ['Отдел товара'],
+    'store': ['Адрес магазина'],
+}
+
+def match_sale_costs(star_schema):
+    """
+    Сопоставляет каждой продаже цену последнего поступления того же товара
+    в тот же магазин не позже даты продажи (as-of join по отсортированным датам,
+    pd.merge_asof по целочисленному ключу товар-магазин — один проход по всем данным).
+    Продажам без более раннего поступления (выгрузка начинается с середины)
+    берётся цена ближайшего следующего поступления; если поступлений нет вовсе,
+    себестоимость неизвестна (NaN).
+    Возвращает DataFrame продаж: 'Ключ товара', 'Ключ магазина', 'Дата', 'Выручка', 'Себестоимость'.
+    """
+    fact = star_schema.fact
+    product_key = fact['Ключ товара'].to_numpy()
+    store_key = fact['Ключ магазина'].to_numpy()
+    pair = product_key.astype(np.int64) * (len(star_schema.stores) + 1) + (store_key + 1)
+    operations = fact['Тип операции']
+    valid = product_key >= 0
+    is_sale = (operations == 'Продажа').to_numpy() & valid
+    is_purchase = (operations == 'Поступление').to_numpy() & valid
+
+    sales = pd.DataFrame({
+        'Пара': pair[is_sale],
+        'Ключ товара': product_key[is_sale],
+        'Ключ магазина': store_key[is_sale],
+        'Дата': fact['Дата'].to_numpy()[is_sale],
+        'Количество': fact['Количество упаковок, шт.'].to_numpy()[is_sale],
+        'Выручка': fact['Сумма операции'].to_numpy()[is_sale],
+    }).sort_values('Дата', kind='stable')
+    receipts = pd.DataFrame({
+        'Пара': pair[is_purchase],
+        'Дата': fact['Дата'].to_numpy()[is_purchase],
+        'Цена закупки': fact['Цена руб./шт.'].to_numpy()[is_purchase],
+    }).sort_values('Дата', kind='stable')
+
+    matched = pd.merge_asof(sales, receipts, on='Дата', by='Пара', direction='backward')
+    unmatched = matched['Цена закупки'].isna().to_numpy()
+    if unmatched.any():
+        forward = pd.merge_asof(matched.loc[unmatched, ['Дата', 'Пара']], receipts,
+                                on='Дата', by='Пара', direction='forward')
+        matched.loc[unmatched, 'Цена закупки'] = forward['Цена закупки'].to_numpy()
+        logger.info(f"{int(unmatched.sum())} продаж без предшествующего поступления: "
+                    f"взята цена следующего поступления.")
+
+    matched['Себестоимость'] = matched['Количество'] * matched['Цена закупки']
+    return matched[['Ключ товара', 'Ключ магазина', 'Дата', 'Выручка', 'Себестоимость']]
+
+def calculate_gross_margin(data_clean, period='D', by=None, star_schema=None):
+    """
+    Валовая прибыль по периодам: выручка продаж минус себестоимость проданного,
+    где себестоимость каждой продажи — количество x цена последнего поступления
+    того же товара в тот же магазин (match_sale_costs). В отличие от
+    calculate_profit_by_period крупные закупки не дают "убытка" в день поступления.
+    Параметры:
+        data_clean (pd.DataFrame): Очищенные данные
+        period (str): Период ('D', 'W', 'M', 'Q', 'Y' или финансовый, например 'Q-MAR')
+        by (str): None — итог, 'sku' — по товарам, 'department' — по отделам, 'store' — по магазинам
+        star_schema (StarSchema): Готовая звёздная схема (иначе строится здесь)
+    Возвращает:
+        pd.DataFrame: 'Дата', ключи группы, 'Выручка', 'Себестоимость', 'Валовая_прибыль',
+                      'Маржа_%'. Продажи с неизвестной себестоимостью не учитываются.
+    """
+    if by is not None and by not in MARGIN_GROUPS:
+        logger.error(f"НЕВЕРНАЯ ГРУППИРОВКА: {by}. Допустимо: None, {list(MARGIN_GROUPS)}")
+        return None
+    if star_schema is None:
+        if data_clean is None or len(data_clean) == 0:
+            logger.warning("Нет данных для расчёта валовой прибыли.")
+            return None
+        star_schema = build_star_schema(data_clean)
+        if star_schema is None:
+            return None
+
+    try:
+        sales = match_sale_costs(star_schema)
+        if len(sales) == 0:
+            logger.warning("Нет данных о продажах.")
+            return None
+        unknown = sales['Себестоимость'].isna()
+        if unknown.any():
+            logger.warning(f"Для {int(unknown.sum())} продаж нет ни одного поступления — "
+                           f"себестоимость неизвестна, продажи не учтены.")
+            sales = sales[~unknown]
+
+        # Начало периода: для дней — сама дата
+        dates = sales['Дата'].dt.normalize()
+        if period != 'D':
+            dates = dates.dt.to_period(period).dt.start_time
+        group_keys = [dates.rename('Дата')]
+        if by == 'sku':
+            group_keys.append(sales['Ключ товара'])
+        elif by == 'department':
+            departments = star_schema.products['Отдел товара'].to_numpy()
+            group_keys.append(pd.Series(departments[sales['Ключ товара'].to_numpy()],
+                                        index=sales.index, name='Отдел товара'))
+        elif by == 'store':
+            group_keys.append(sales['Ключ магазина'])
+
+        margin = sales.groupby(group_keys, sort=True)[['Выручка', 'Себестоимость']].sum().reset_index()
+        margin['Валовая_прибыль'] = margin['Выручка'] - margin['Себестоимость']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            margin['Маржа_%'] = np.where(margin['Выручка'] != 0,
+                                         margin['Валовая_прибыль'] / margin['Выручка'] * 100, np.nan)
+
+        # Названия товаров и магазинов — по ключам, только для итоговых строк
+        if by == 'sku':
+            margin = _attach_product_names(star_schema, margin, position=1)
+        elif by == 'store':
+            store_names = star_schema.stores['Адрес магазина'].to_numpy()
+            keys = margin['Ключ магазина'].to_numpy()
+            margin.insert(1, 'Адрес магазина', np.where(keys >= 0, store_names[np.maximum(keys, 0)], None))
+            margin = margin.drop(columns='Ключ магазина')
+
+        logger.info(f"Валовая прибыль по периоду '{period}'" + (f" ({by})" if by else "") +
+                    f" рассчитана: {len(margin)} строк.")
+        return margin
+
+    except Exception as e:
+        logger.error(f"ОШИБКА ПРИ РАСЧЁТЕ ВАЛОВОЙ ПРИБЫЛИ: {e}")
+        return None
+
 def aggregate_sales_by_category(data_clean):
     """
     Группирует все данные по категориям товаров (“Отдел товаров”)
@@ -308,9 +602,12 @@ def aggregate_sales_by_category(data_clean):
         logger.error(f"ОШИБКА ПРИ АШРЕГАЦИИ ПО КАТЕГОРИЯМ: {e}")
         return None
 
-def get_top_n_products(data_clean, n=5, metric='quantity'):
+def get_top_n_products(data_clean, n=5, metric='quantity', star_schema=None):
     """
     Находит топ-N проданных товаров по выбранному критерию.
+    n=None — все товары, отсортированные по метрике.
+    Агрегация идёт по целочисленному ключу товара звёздной схемы (build_star_schema);
+    названия подставляются только для итоговых строк.
     """
     if data_clean is None or len(data_clean) == 0:
         logger.warning("Нет данных для поиска топ-продуктов.")
@@ -322,96 +619,100 @@ def get_top_n_products(data_clean, n=5, metric='quantity'):
         return None
     
     try:
-        # Получаем только продажи
-        sales_data = get_operational_data(data_clean, operation_type='Продажа')
-        if sales_data is None or len(sales_data) == 0:
+        if star_schema is None:
+            star_schema = build_star_schema(data_clean)
+            if star_schema is None:
+                return None
+
+        # Суммы продаж по ключу товара
+        is_sale = (star_schema.fact['Тип операции'] == 'Продажа').to_numpy()
+        if not is_sale.any():
             logger.warning("Нет данных о продажах.")
             return None
-        
-        # Группируем по товарам
-        product_sales = sales_data.groupby(['Артикул', 'Название товара']).agg({
-            'Сумма операции': 'sum',
-            'Количество упаковок, шт.': 'sum'
-        }).reset_index()
-        
-        product_sales = product_sales.rename(columns={
-            'Сумма операции': 'Выручка',
-            'Количество упаковок, шт.': 'Кол-во_упаковок'
+        revenue, sold = _sum_by_product(star_schema, is_sale, 'Сумма операции')
+        quantity, _ = _sum_by_product(star_schema, is_sale, 'Количество упаковок, шт.')
+        keys = np.flatnonzero(sold)
+
+        product_sales = pd.DataFrame({
+            'Ключ товара': keys,
+            'Выручка': revenue[keys],
+            'Кол-во_упаковок': quantity[keys]
         })
         
-        # Сортировка по выбранной метрике
-        if metric == 'quantity':
-            top_products = product_sales.sort_values('Кол-во_упаковок', ascending=False).head(n)
-        else:  # metric == 'revenue'
-            top_products = product_sales.sort_values('Выручка', ascending=False).head(n)
+        # Сортировка по выбранной метрике; при равенстве — по ключу товара, то есть
+        # по (Артикул, Название товара), как ORDER BY в SQLite-бэкенде
+        metric_column = 'Кол-во_упаковок' if metric == 'quantity' else 'Выручка'
+        top_products = product_sales.sort_values([metric_column, 'Ключ товара'],
+                                                 ascending=[False, True], kind='stable')
+        if n is not None:
+            top_products = top_products.head(n)
+
+        top_products = _attach_product_names(star_schema, top_products)
         
         logger.info(f"Топ-{n} продуктов по {metric} найдено.")
-        return top_products.reset_index(drop=True)
+        return top_products
         
     except Exception as e:
         logger.error(f"ОШИБКА ПРИ ПОИСКЕ ТОП-ПРОДУКТОВ: {e}")
         return None
 
-def analyze_inventory_turnover(data_clean, top_n=10):
+def analyze_inventory_turnover(data_clean, top_n=10, star_schema=None):
     """
     Анализирует движение товаров, сопоставляя объёмы продаж и поступлений
-    по каждому товару (артикулу).
+    по каждому товару (артикулу). top_n=None — все товары.
+    Считается по ключам звёздной схемы (build_star_schema).
     """
     if data_clean is None or len(data_clean) == 0:
         logger.warning("Нет данных для анализа оборачиваемости.")
         return None
     
     try:
-        # Получаем продажи
-        sales = get_operational_data(data_clean, operation_type='Продажа')
-        if sales is None or len(sales) == 0:
+        if star_schema is None:
+            star_schema = build_star_schema(data_clean)
+            if star_schema is None:
+                return None
+
+        operations = star_schema.fact['Тип операции']
+        is_sale = (operations == 'Продажа').to_numpy()
+        is_purchase = (operations == 'Поступление').to_numpy()
+        if not is_sale.any():
             logger.warning("Нет данных о продажах.")
             return None
-        
-        # Получаем поступления
-        purchases = get_operational_data(data_clean, operation_type='Поступление')
-        if purchases is None or len(purchases) == 0:
+        if not is_purchase.any():
             logger.warning("Нет данных о поступлениях.")
             return None
-        
-        # Группируем продажи по товарам
-        sales_by_product = sales.groupby(['Артикул', 'Название товара']).agg({
-            'Количество упаковок, шт.': 'sum',
-            'Сумма операции': 'sum'
-        }).reset_index()
-        sales_by_product = sales_by_product.rename(columns={
-            'Количество упаковок, шт.': 'Продано_упаковок',
-            'Сумма операции': 'Выручка_от_продаж'
-        })
-        
-        # Группируем поступления по товарам
-        purchases_by_product = purchases.groupby(['Артикул', 'Название товара']).agg({
-            'Количество упаковок, шт.': 'sum'
-        }).reset_index()
-        purchases_by_product = purchases_by_product.rename(columns={
-            'Количество упаковок, шт.': 'Поступлено_упаковок'
+
+        # Продажи и поступления по ключу товара
+        sold, has_sales = _sum_by_product(star_schema, is_sale, 'Количество упаковок, шт.')
+        revenue, _ = _sum_by_product(star_schema, is_sale, 'Сумма операции')
+        received, has_purchases = _sum_by_product(star_schema, is_purchase, 'Количество упаковок, шт.')
+
+        # Товары, у которых есть продажи или поступления (как outer merge)
+        keys = np.flatnonzero(has_sales | has_purchases)
+        inventory_analysis = pd.DataFrame({
+            'Ключ товара': keys,
+            'Продано_упаковок': _outer_filled(sold, has_sales, keys),
+            'Выручка_от_продаж': _outer_filled(revenue, has_sales, keys),
+            'Поступлено_упаковок': _outer_filled(received, has_purchases, keys)
         })
         
-        # Объединяем
-        inventory_analysis = pd.merge(
-            sales_by_product,
-            purchases_by_product,
-            on=['Артикул', 'Название товара'],
-            how='outer'
-        ).fillna(0)
-        
         # Рассчитываем разницу
         inventory_analysis['Разница_упаковок'] = (
             inventory_analysis['Продано_упаковок'] - inventory_analysis['Поступлено_упаковок']
         )
         
-        # Сортируем по абсолютному значению разницы
+        # Сортируем по абсолютному значению разницы, при равенстве — по (Артикул, Название товара)
         inventory_analysis['Абс_разница'] = inventory_analysis['Разница_упаковок'].abs()
-        inventory_analysis = inventory_analysis.sort_values('Абс_разница', ascending=False).head(top_n)
+        inventory_analysis = inventory_analysis.sort_values(['Абс_разница', 'Ключ товара'],
+                                                            ascending=[False, True], kind='stable')
+        if top_n is not None:
+            inventory_analysis = inventory_analysis.head(top_n)
         inventory_analysis = inventory_analysis.drop(columns=['Абс_разница'])
 
+        inventory_analysis = _attach_product_names(star_schema, inventory_analysis)
+
         logger.info(f"Анализ оборачиваемости завершён. Топ-{top_n} товаров.")
-        return inventory_analysis.reset_index(drop=True)
+        return inventory_analysis
         
     except Exception as e:
         logger.error(f"ОШИБКА ПРИ АНАЛИЗЕ ОБОРАЧИВАЕМОСТИ: {e}")
@@ -427,7 +728,7 @@ def calculate_reorder_point(lead_time_days, avg_daily_sales, safety_stock):
     """
     return int(lead_time_days * avg_daily_sales + safety_stock)
     
-def identify_slow_moving_items(data, days_back=90, sales_threshold=5):
+def identify_slow_moving_items(data, days_back=90, sales_threshold=5, as_of=None, star_schema=None):
     """
     Выявляет товары, которые "застоялись" на складе — мало продаются, но есть в остатках.
     Параметры:
@@ -435,6 +736,10 @@ def identify_slow_moving_items(data, days_back=90, sales_threshold=5):
         days_back (int): Количество дней назад, за которые анализируется спрос (по умолчанию 90)
         sales_threshold (int): Максимальное количество проданных упаковок за период, 
                               после которого товар считается "медленно движущимся" (по умолчанию 5)
+        as_of (pd.Timestamp): Момент, на который строится отчёт (по умолчанию — начало текущих суток).
+                              Период — ровно days_back дней по as_of включительно: операции с датой
+                              строго позже as_of - days_back
+        star_schema (StarSchema): Готовая звёздная схема data (иначе строится здесь)
     Возвращает:
         pd.DataFrame: Таблица с товарами, которые нужно "разогнать"
                      Столбцы: 'Артикул', 'Название товара', 'Продано за период', 'Текущий остаток', 'Дней с последней продажи'
@@ -443,48 +748,159 @@ def identify_slow_moving_items(data, days_back=90, sales_threshold=5):
         return pd.DataFrame()
 
     # Определяем дату начала анализа
-    cutoff_date = pd.Timestamp.now() - pd.Timedelta(days=days_back)
-
-    # Фильтруем только продажи за последние N дней
-    sales_data = data[
-        (data['Тип операции'] == 'Продажа') & 
-        (data['Дата'] >= cutoff_date)
-    ].copy()
-
-    # Группируем по товару: суммируем продажи
-    sales_summary = sales_data.groupby(['Артикул', 'Название товара'])['Количество упаковок, шт.'].sum().reset_index()
-    sales_summary.rename(columns={'Количество упаковок, шт.': 'Продано за период'}, inplace=True)
-
-    # Мы не храним баланс в исходных данных — нужно посчитать: Поступления - Продажи по каждому артикулу
-    # Создаём общий свод по каждому товару
-    all_data = data.copy()
-    # Продажи
-    sales_by_sku = all_data[all_data['Тип операции'] == 'Продажа'].groupby(['Артикул', 'Название товара'])['Количество упаковок, шт.'].sum().reset_index()
-    sales_by_sku.rename(columns={'Количество упаковок, шт.': 'Продано_всего'}, inplace=True)
-    
-    # Поступления
-    purchases_by_sku = all_data[all_data['Тип операции'] == 'Поступление'].groupby(['Артикул', 'Название товара'])['Количество упаковок, шт.'].sum().reset_index()
-    purchases_by_sku.rename(columns={'Количество упаковок, шт.': 'Поступлено_всего'}, inplace=True)
-    
-    # Объединяем: текущий остаток = Поступления - Продажи
-    inventory = sales_by_sku.merge(purchases_by_sku, on=['Артикул', 'Название товара'], how='outer').fillna(0)
-    inventory['Текущий остаток'] = inventory['Поступлено_всего'] - inventory['Продано_всего']
-    
+    as_of = pd.Timestamp.now().normalize() if as_of is None else pd.Timestamp(as_of)
+    # Граница не входит в период: при as_of на полночь ровно days_back календарных дней
+    cutoff_date = as_of - pd.Timedelta(days=days_back)
+
+    if star_schema is None:
+        star_schema = build_star_schema(data)
+        if star_schema is None:
+            return pd.DataFrame()
+    fact = star_schema.fact
+    operations = fact['Тип операции']
+    is_sale = (operations == 'Продажа').to_numpy()
+    is_purchase = (operations == 'Поступление').to_numpy()
+    in_period = is_sale & (fact['Дата'] > cutoff_date).to_numpy()
+
+    # Мы не храним баланс в исходных данных — текущий остаток = Поступления - Продажи по каждому товару
+    sold_total, has_sales = _sum_by_product(star_schema, is_sale, 'Количество упаковок, шт.')
+    received_total, has_purchases = _sum_by_product(star_schema, is_purchase, 'Количество упаковок, шт.')
+    keys = np.flatnonzero(has_sales | has_purchases)
+    stock = (_outer_filled(received_total, has_purchases, keys)
+             - _outer_filled(sold_total, has_sales, keys))
+
     # Оставляем только товары с остатком > 0
-    inventory = inventory[inventory['Текущий остаток'] > 0]
+    keys, stock = keys[stock > 0], stock[stock > 0]
+
+    # Продажи за последние N дней (товары без продаж за период — 0)
+    sold_period, has_period_sales = _sum_by_product(star_schema, in_period, 'Количество упаковок, шт.')
+    sold_period = _outer_filled(sold_period, has_period_sales, keys)
 
-    # Объединяем с продажами за последние 90 дней
-    merged = inventory.merge(sales_summary, on=['Артикул', 'Название товара'], how='left').fillna(0)
+    # "Дней с последней продажи" — по последней продаже за период
+    period_keys = fact['Ключ товара'].to_numpy()[in_period]
+    period_dates = fact['Дата'].to_numpy()[in_period]
+    valid = period_keys >= 0
+    last_sale = np.full(len(star_schema.products), np.datetime64('NaT'), dtype=period_dates.dtype)
+    if valid.any():
+        last_sale[:] = period_dates[valid].min()
+        np.maximum.at(last_sale, period_keys[valid], period_dates[valid])
+        last_sale[~has_period_sales] = np.datetime64('NaT')
+
+    slow_moving = pd.DataFrame({
+        'Ключ товара': keys,
+        'Продано за период': sold_period,
+        'Текущий остаток': stock,
+        'Дней с последней продажи': (as_of - pd.Series(last_sale[keys])).dt.days
+    })
 
     # Фильтруем: продажи <= порога
-    slow_moving = merged[merged['Продано за период'] <= sales_threshold].copy()
+    slow_moving = slow_moving[slow_moving['Продано за период'] <= sales_threshold]
 
-    # Добавляем: "Дней с последней продажи"
-    last_sale_dates = sales_data.groupby(['Артикул', 'Название товара'])['Дата'].max().reset_index()
-    last_sale_dates['Дней с последней продажи'] = (pd.Timestamp.now() - last_sale_dates['Дата']).dt.days
-    slow_moving = slow_moving.merge(last_sale_dates[['Артикул', 'Название товара', 'Дней с последней продажи']], on=['Артикул', 'Название товара'], how='left')
+    # Сортируем; при равенстве — по (Артикул, Название товара)
+    slow_moving = slow_moving.sort_values(['Продано за период', 'Дней с последней продажи', 'Ключ товара'],
+                                          ascending=[True, False, True], kind='stable')
 
-    # Сортируем
-    slow_moving = slow_moving.sort_values(['Продано за период', 'Дней с последней продажи'], ascending=[True, False])
-    
-    return slow_moving[['Артикул', 'Название товара', 'Продано за период', 'Текущий остаток', 'Дней с последней продажи']].reset_index(drop=True)
+    slow_moving = _attach_product_names(star_schema, slow_moving)
+    return slow_moving[['Артикул', 'Название товара', 'Продано за период', 'Текущий остаток', 'Дней с последней продажи']]
+
+def classify_abc_xyz(data_clean, by_store=False, abc_thresholds=(0.8, 0.95), xyz_thresholds=(0.1, 0.25)):
+    """
+    ABC/XYZ-классификация всего ассортимента за один векторизованный проход.
+    ABC — по накопленной доле выручки (A: до 80%, B: до 95%, C: остальное).
+    XYZ — по коэффициенту вариации дневного спроса (X: <= 0.1, Y: <= 0.25, Z: выше).
+    Дни без продаж считаются днями с нулевым спросом — начиная с первого поступления
+    или продажи ряда до последнего дня выгрузки (до появления товара дней не считаем).
+    Строки без артикула, названия (или магазина при by_store) не классифицируются
+    и в доли выручки не входят.
+    Параметры:
+        data_clean (pd.DataFrame): Очищенные данные
+        by_store (bool): Классифицировать пары (товар, магазин) внутри каждого магазина
+        abc_thresholds (tuple): Границы накопленной доли выручки для классов A и B
+        xyz_thresholds (tuple): Границы коэффициента вариации для классов X и Y
+    Возвращает:
+        pd.DataFrame: по строке на товар (или товар-магазин) с выручкой, долей,
+                      средним спросом, коэффициентом вариации и классами ABC, XYZ, ABC_XYZ
+    """
+    if data_clean is None or len(data_clean) == 0:
+        logger.warning("Нет данных для ABC/XYZ-классификации.")
+        return None
+
+    try:
+        keys = ['Артикул', 'Название товара']
+        if by_store:
+            keys = ['Адрес магазина'] + keys
+        # Строки с пропуском в ключе не классифицируются — как в остальных товарных
+        # отчётах (топ, оборачиваемость, застоявшиеся товары)
+        has_key = data_clean[keys].notna().all(axis=1)
+
+        sales = data_clean[(data_clean['Тип операции'] == 'Продажа') & has_key]
+        if len(sales) == 0:
+            logger.warning("Нет данных о продажах.")
+            return None
+
+        # Номер ряда (товар или товар-магазин) и номер дня для каждой строки продаж
+        series_codes, series_index = pd.MultiIndex.from_frame(sales[keys]).factorize()
+        days = sales['Дата'].dt.normalize()
+        # Календарь — вся выгрузка, включая строки без ключа
+        is_movement = data_clean['Тип операции'].isin(['Продажа', 'Поступление'])
+        movements = data_clean[is_movement]
+        first_day = movements['Дата'].min().normalize()
+        last_day = movements['Дата'].max().normalize()
+        day_codes = ((days - first_day).dt.days).to_numpy()
+        n_series = len(series_index)
+        n_days = (last_day - first_day).days + 1
+
+        # Число дней истории каждого ряда: от первого поступления или продажи до конца выгрузки
+        series_start = data_clean[is_movement & has_key].groupby(keys, sort=False)['Дата'].min().reindex(series_index)
+        series_days = (last_day - series_start.dt.normalize()).dt.days.to_numpy() + 1
+
+        # Спрос по ячейкам матрицы (ряд x день); нулевые ячейки не хранятся —
+        # они не влияют на суммы, а число дней известно
+        cell = series_codes.astype(np.int64) * n_days + day_codes
+        cell_codes, cell_index = pd.factorize(cell)
+        qty = np.bincount(cell_codes, weights=sales['Количество упаковок, шт.'].to_numpy(dtype=float))
+        cell_series = (cell_index // n_days).astype(np.int64)
+
+        demand_sum = np.bincount(cell_series, weights=qty, minlength=n_series)
+        demand_sq_sum = np.bincount(cell_series, weights=qty ** 2, minlength=n_series)
+        mean = demand_sum / series_days
+        variance = np.maximum(demand_sq_sum / series_days - mean ** 2, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cv = np.where(mean > 0, np.sqrt(variance) / mean, np.inf)
+
+        revenue = np.bincount(series_codes, weights=sales['Сумма операции'].to_numpy(dtype=float),
+                              minlength=n_series)
+
+        result = series_index.to_frame(index=False, name=keys)
+        result['Выручка'] = revenue
+        result['Средний_спрос_в_день'] = mean
+        result['Коэф_вариации'] = cv
+
+        # ABC: накопленная доля выручки по убыванию (внутри магазина при by_store)
+        group_keys = ['Адрес магазина'] if by_store else None
+        result = result.sort_values((group_keys or []) + ['Выручка'],
+                                    ascending=[True] * len(group_keys or []) + [False],
+                                    kind='stable').reset_index(drop=True)
+        if by_store:
+            cumulative = result.groupby('Адрес магазина')['Выручка'].cumsum()
+            total = result.groupby('Адрес магазина')['Выручка'].transform('sum')
+        else:
+            cumulative = result['Выручка'].cumsum()
+            total = result['Выручка'].sum()
+        share_before = (cumulative - result['Выручка']) / total
+        result['Доля_выручки'] = result['Выручка'] / total
+        result['Накопленная_доля'] = cumulative / total
+        # Класс определяется по доле до включения товара: первый товар всегда A
+        result['ABC'] = np.select([share_before < abc_thresholds[0], share_before < abc_thresholds[1]],
+                                  ['A', 'B'], default='C')
+        result['XYZ'] = np.select([result['Коэф_вариации'] <= xyz_thresholds[0],
+                                   result['Коэф_вариации'] <= xyz_thresholds[1]],
+                                  ['X', 'Y'], default='Z')
+        result['ABC_XYZ'] = result['ABC'] + result['XYZ']
+
+        logger.info(f"ABC/XYZ-классификация завершена: {n_series} рядов, {n_days} дней.")
+        return result
+
+    except Exception as e:
+        logger.error(f"ОШИБКА ПРИ ABC/XYZ-КЛАССИФИКАЦИИ: {e}")
+        return None
@@ -0,0 +1,110 @@
+"""
+Формирование и сохранение текстового отчёта по продажам и инвентарю.
+"""
+import pandas as pd
+
+def save_report_to_file(report_text, filename="inventory_report.txt"):
+    """
+    Сохраняет отчёт в текстовый файл. report_text — готовая строка или
+    итерируемый набор строк (например, генератор), которые пишутся по одной.
+    """
+    lines = [report_text] if isinstance(report_text, str) else report_text
+    with open(filename, "w", encoding="utf-8") as f:
+        for i, line in enumerate(lines):
+            f.write(line if i == 0 else "\n" + line)
+    print(f" Отчёт сохранён в файл: {filename}")
+
+def build_text_report(manager, title="ОТЧЁТ ПО АНАЛИЗУ ПРОДАЖ И ИНВЕНТАРЯ"):
+    """
+    Выполняет все анализы InventoryManager и возвращает строки текстового отчёта.
+    """
+    # Выручка и прибыль
+    revenue = manager.analyze_revenue(period='D')
+    profit = manager.analyze_profit(period='D')
+    margin = manager.analyze_margin(period='D')
+
+    # Анализ по категориям
+    category_stats = manager.analyze_by_category()
+
+    # Топ-5 товаров по продажам
+    top_products_qty = manager.top_products(n=5, metric='quantity')
+    top_products_rev = manager.top_products(n=5, metric='revenue')
+
+    # Оборачиваемость
+    turnover_analysis = manager.inventory_turnover(top_n=10)
+
+    # --- МЕДЛЕННО ДВИЖУЩИЕСЯ ТОВАРЫ ---
+    slow_moving = manager.get_slow_moving_items_report(days_back=90, sales_threshold=5)
+    print("Анализ медленно движущихся товаров завершён.")
+
+    # Формирование текстового отчёта
+    report = []
+
+    report.append(title)
+    report.append("="*70)
+    report.append(f"Дата генерации: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    report.append(f"Обработано строк: {manager.processed_rows()}")
+    for file, removed in manager.dedup_stats.items():
+        report.append(f"Удалено дубликатов операций из {file}: {removed}")
+    report.append("")
+
+    # Выручка
+    if revenue is not None and not revenue.empty:
+        report.append(" ВЫРУЧКА ПО ДНЯМ (первые 10 записей):")
+        report.append(revenue.head(10).to_string(index=False))
+        report.append("")
+    else:
+        report.append("НЕТ ДАННЫХ О ВЫРУЧКЕ.")
+
+    # Прибыль
+    if profit is not None and not profit.empty:
+        report.append(" ПРИБЫЛЬ ПО ДНЯМ (первые 10 записей):")
+        report.append(profit.head(10).to_string(index=False))
+        report.append("")
+    else:
+        report.append("НЕТ ДАННЫХ О ПРИБЫЛИ.")
+
+    # Валовая прибыль (себестоимость по цене последнего поступления)
+    if margin is not None and not margin.empty:
+        report.append(" ВАЛОВАЯ ПРИБЫЛЬ ПО ДНЯМ (первые 10 записей):")
+        report.append(margin.head(10).to_string(index=False))
+        report.append("")
+    else:
+        report.append("НЕТ ДАННЫХ О ВАЛОВОЙ ПРИБЫЛИ.")
+
+    # Категории
+    if category_stats is not None and not category_stats.empty:
+        report.append(" ПРОДАЖИ ПО ОТДЕЛАМ:")
+        report.append(category_stats.to_string())
+        report.append("")
+
+    # Топ-5 по количеству
+    if top_products_qty is not None and not top_products_qty.empty:
+        report.append(" ТОП-5 ТОВАРОВ ПО КОЛИЧЕСТВУ ПРОДАННЫХ ЕДИНИЦ:")
+        report.append(top_products_qty.to_string(index=False))
+        report.append("")
+
+    # Топ-5 по выручке
+    if top_products_rev is not None and not top_products_rev.empty:
+        report.append(" ТОП-5 ТОВАРОВ ПО ВЫРУЧКЕ:")
+        report.append(top_products_rev.to_string(index=False))
+        report.append("")
+
+    # Оборачиваемость
+    if turnover_analysis is not None and not turnover_analysis.empty:
+        report.append(" АНАЛИЗ ОБОРАЧИВАЕМОСТИ ТОВАРОВ (ТОП-10):")
+        report.append(turnover_analysis.to_string(index=False))
+        report.append("")
+
+    # --- МЕДЛЕННО ДВИЖУЩИЕСЯ ТОВАРЫ ---
+    if slow_moving is not None and not slow_moving.empty:
+        report.append(" ТОВАРЫ, КОТОРЫЕ 'ЗАСТОЯЛИСЬ' НА СКЛАДЕ (за 90 дней):")
+        report.append(slow_moving.to_string(index=False))
+        report.append("")
+    else:
+        report.append("  НЕТ ТОВАРОВ, КОТОРЫЕ ЗАСТОЯЛИСЬ НА СКЛАДЕ (все товары активны).")
+        report.append("")
+
+    report.append(" АНАЛИЗ ЗАВЕРШЁН.")
+
+    return report
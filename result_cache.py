@@ -0,0 +1,193 @@
+"""
+Дисковый кэш результатов анализа.
+
+Ключ записи — отпечаток входных данных (для файлов: путь, размер и время
+изменения, без чтения строк) плюс имя анализа и его параметры. Таблица
+результата хранится в колоночном бинарном виде: каждый столбец — отдельный
+массив NumPy внутри .npz (без pickle), типы столбцов описаны в служебном поле.
+Размер кэша ограничен: при превышении удаляются записи, к которым дольше
+всего не обращались (LRU по времени изменения файла, обновляемому при чтении).
+"""
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Увеличивается при изменении логики анализов или формата записей,
+# чтобы старые записи перестали совпадать с новыми ключами.
+# 2 — XYZ по дням с первого движения ряда, отчёт о застоявшихся товарах на начало суток
+# 3 — период застоявшихся товаров ровно days_back дней (граница отсечки не входит)
+# 4 — товары с равными значениями метрики упорядочены по (Артикул, Название товара)
+# 5 — ABC/XYZ без строк с пропуском в ключе товара
+CACHE_VERSION = 5
+
+_META_KEY = '__meta__'
+
+
+def fingerprint_files(files, **options):
+    """
+    Отпечаток набора файлов по пути, размеру и времени изменения.
+    options — параметры загрузки, влияющие на результат (например, deduplicate).
+    """
+    digest = hashlib.sha1()
+    for file in files:
+        try:
+            stat = os.stat(file)
+            digest.update(f"{os.path.abspath(file)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode('utf-8'))
+        except OSError:
+            digest.update(f"{os.path.abspath(file)}|missing\n".encode('utf-8'))
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode('utf-8'))
+    return 'files:' + digest.hexdigest()
+
+
+def fingerprint_frame(data):
+    """Отпечаток DataFrame по содержимому (для данных, полученных не из файлов)."""
+    digest = hashlib.sha1()
+    digest.update(json.dumps([str(c) for c in data.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return 'frame:' + digest.hexdigest()
+
+
+def _encode_frame(frame):
+    """DataFrame -> словарь массивов для np.savez (один массив на столбец)."""
+    index_names = []
+    if not isinstance(frame.index, pd.RangeIndex):
+        index_names = [name if name is not None else f'__index_{i}' for i, name in enumerate(frame.index.names)]
+        frame = frame.reset_index(names=index_names)
+    else:
+        frame = frame.reset_index(drop=True)
+
+    arrays, columns = {}, []
+    for i, name in enumerate(frame.columns):
+        column = frame[name]
+        if pd.api.types.is_bool_dtype(column.dtype) or pd.api.types.is_numeric_dtype(column.dtype) \
+                or pd.api.types.is_datetime64_any_dtype(column.dtype):
+            kind = 'numeric'
+            arrays[f'c{i}'] = column.to_numpy()
+        else:
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                kind = 'category'
+            elif column.dtype == object:
+                if pd.api.types.infer_dtype(column, skipna=True) not in ('string', 'empty'):
+                    raise TypeError(f"столбец {name!r} не поддерживается кэшем (смешанные типы)")
+                kind = 'object'
+            else:
+                kind = 'str'
+            text = column.astype('string')
+            arrays[f'm{i}'] = text.isna().to_numpy()
+            arrays[f'c{i}'] = text.fillna('').to_numpy(dtype=str)
+        columns.append({'name': str(name), 'kind': kind})
+
+    meta = {'columns': columns, 'index': index_names}
+    arrays[_META_KEY] = np.array(json.dumps(meta, ensure_ascii=False))
+    return arrays
+
+
+def _decode_frame(arrays):
+    """Обратное преобразование _encode_frame."""
+    meta = json.loads(str(arrays[_META_KEY]))
+    data = {}
+    for i, column in enumerate(meta['columns']):
+        values = arrays[f'c{i}']
+        if column['kind'] == 'numeric':
+            data[column['name']] = values
+            continue
+        series = pd.Series(values, dtype='str').mask(arrays[f'm{i}'])
+        if column['kind'] != 'str':
+            series = series.astype(column['kind'])
+        data[column['name']] = series
+    frame = pd.DataFrame(data)
+    if meta['index']:
+        frame = frame.set_index(meta['index'])
+        frame.index.names = [None if str(name).startswith('__index_') else name for name in frame.index.names]
+    return frame
+
+
+class ResultCache:
+    """
+    Кэш таблиц-результатов в каталоге path, не более max_bytes на диске.
+    get/put работают только с DataFrame; прочие результаты не кэшируются.
+    """
+
+    def __init__(self, path='.analysis_cache', max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_path(self, fingerprint, name, params):
+        key = json.dumps({'version': CACHE_VERSION, 'data': fingerprint, 'name': name, 'params': params},
+                         sort_keys=True, default=str)
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz')
+
+    def get(self, fingerprint, name, **params):
+        """Возвращает сохранённую таблицу или None, если записи нет."""
+        entry = self._entry_path(fingerprint, name, params)
+        try:
+            with np.load(entry, allow_pickle=False) as arrays:
+                frame = _decode_frame(arrays)
+        except FileNotFoundError:
+            self.misses += 1
+            CACHE_REQUESTS.inc(result='miss')
+            return None
+        except Exception as e:
+            logger.error(f"ОШИБКА ПРИ ЧТЕНИИ КЭША {entry}: {e}")
+            self.misses += 1
+            CACHE_REQUESTS.inc(result='miss')
+            return None
+        # Отмечаем обращение: по времени изменения выбираются записи для вытеснения
+        os.utime(entry)
+        self.hits += 1
+        CACHE_REQUESTS.inc(result='hit')
+        logger.info(f"Кэш: {name} {params} — найдено.")
+        return frame
+
+    def put(self, fingerprint, name, result, **params):
+        """Сохраняет таблицу-результат и вытесняет старые записи сверх лимита."""
+        if not isinstance(result, pd.DataFrame):
+            return result
+        entry = self._entry_path(fingerprint, name, params)
+        tmp_path = entry[:-len('.npz')] + '.tmp.npz'
+        try:
+            np.savez(tmp_path, **_encode_frame(result))
+            os.replace(tmp_path, entry)
+        except Exception as e:
+            logger.error(f"ОШИБКА ПРИ ЗАПИСИ В КЭШ {name}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return result
+        self._evict()
+        return result
+
+    def size(self):
+        """Суммарный размер записей на диске, байт."""
+        return sum(os.path.getsize(os.path.join(self.path, f))
+                   for f in os.listdir(self.path) if f.endswith('.npz'))
+
+    def clear(self):
+        """Удаляет все записи кэша."""
+        for f in os.listdir(self.path):
+            if f.endswith('.npz'):
+                os.remove(os.path.join(self.path, f))
+
+    def _evict(self):
+        entries = []
+        for f in os.listdir(self.path):
+            if f.endswith('.npz') and not f.endswith('.tmp.npz'):
+                stat = os.stat(os.path.join(self.path, f))
+                entries.append((stat.st_mtime_ns, stat.st_size, f))
+        total = sum(size for _, size, _ in entries)
+        for _, size, f in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.path, f))
+            total -= size
+            logger.info(f"Кэш: вытеснена запись {f}")
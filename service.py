@@ -0,0 +1,249 @@
+"""
+Резидентный аналитический сервис.
+Данные загружаются и предобрабатываются один раз при старте, после чего
+аналитика InventoryManager отдаётся в виде JSON по HTTP (или через Unix-сокет).
+При изменении исходных файлов данные перезагружаются в фоне, а запросы
+продолжают обслуживаться на старой версии до момента подмены.
+
+Пример запуска:
+    python service.py --port 8080
+    python service.py --unix /tmp/inventory.sock
+Пример запроса:
+    curl "http://127.0.0.1:8080/top?n=5&metric=revenue"
+Неверные параметры запроса (неизвестный период, метрика, нечисловое n) —
+ответ 400 с описанием ошибки, а не пустой список.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+from manager import InventoryManager
+from process import is_valid_period
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FILES = ["Данные 1.csv", "Данные 2.csv"]
+
+HTTP_STATUSES = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                 405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+
+def _int_param(params, name, default, minimum=0):
+    """Достаёт целочисленный параметр запроса (ValueError при неверном значении)."""
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise ValueError(f"{name}={values[0]!r} — ожидается целое число") from None
+    if value < minimum:
+        raise ValueError(f"{name}={value} — ожидается число не меньше {minimum}")
+    return value
+
+
+def _str_param(params, name, default, choices=None):
+    values = params.get(name)
+    value = values[0] if values else default
+    if choices is not None and value not in choices:
+        raise ValueError(f"{name}={value!r} — допустимо: {', '.join(choices)}")
+    return value
+
+
+def _period_param(params):
+    period = _str_param(params, 'period', 'D')
+    if not is_valid_period(period):
+        raise ValueError(f"period={period!r} — неизвестный период (например, D, W, M, Q, Y, Q-MAR)")
+    return period
+
+
+# Маршрут -> функция params -> (метод InventoryManager, аргументы).
+# Параметры проверяются до вычислений: ValueError — ответ 400
+ROUTES = {
+    '/revenue': lambda p: ('analyze_revenue', {'period': _period_param(p)}),
+    '/profit': lambda p: ('analyze_profit', {'period': _period_param(p)}),
+    '/categories': lambda p: ('analyze_by_category', {}),
+    '/top': lambda p: ('top_products', {'n': _int_param(p, 'n', 5, minimum=1),
+                                        'metric': _str_param(p, 'metric', 'quantity',
+                                                             choices=('quantity', 'revenue'))}),
+    '/turnover': lambda p: ('inventory_turnover', {'top_n': _int_param(p, 'top_n', 10, minimum=1)}),
+    '/slow-moving': lambda p: ('get_slow_moving_items_report',
+                               {'days_back': _int_param(p, 'days_back', 90),
+                                'sales_threshold': _int_param(p, 'sales_threshold', 5)}),
+}
+
+
+class AnalyticsService:
+    """
+    Держит в памяти подготовленный InventoryManager и отвечает на запросы.
+    Менеджер подменяется целиком после успешной перезагрузки, поэтому
+    параллельные запросы всегда видят согласованную версию данных.
+    Менеджер лениво заполняет свои кэши (звёздная схема, дневная свёртка),
+    поэтому вычисления на одном менеджере идут по очереди под его блокировкой.
+    """
+
+    def __init__(self, files=None, reload_interval=5.0):
+        self.files = list(files or DEFAULT_FILES)
+        self.reload_interval = reload_interval
+        self.manager = None
+        self._manager_lock = threading.Lock()
+        self._signature = None
+        self._reload_lock = asyncio.Lock()
+
+    def _files_signature(self):
+        """Снимок (размер, время изменения) исходных файлов для отслеживания изменений."""
+        signature = []
+        for file in self.files:
+            try:
+                stat = os.stat(file)
+                signature.append((file, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                signature.append((file, None, None))
+        return tuple(signature)
+
+    def _build_manager(self):
+        """Загружает и предобрабатывает данные в новом экземпляре менеджера."""
+        manager = InventoryManager()
+        if not manager.load_files(self.files) or not manager.preprocess():
+            return None
+        return manager
+
+    async def reload(self):
+        """Перезагружает данные в отдельном потоке и атомарно подменяет менеджер."""
+        async with self._reload_lock:
+            signature = self._files_signature()
+            manager = await asyncio.to_thread(self._build_manager)
+            if manager is None:
+                logger.error("ПЕРЕЗАГРУЗКА ДАННЫХ НЕ УДАЛАСЬ. Используется предыдущая версия.")
+                return False
+            # Менеджер и его блокировка подменяются вместе (без await между ними)
+            self.manager, self._manager_lock = manager, threading.Lock()
+            self._signature = signature
+            logger.info(f"Данные загружены: {len(manager.data_clean)} строк.")
+            return True
+
+    async def watch_files(self):
+        """Фоновая задача: перезагружает данные при изменении исходных файлов."""
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            if self._files_signature() != self._signature:
+                logger.info("Исходные файлы изменились, перезагрузка данных...")
+                await self.reload()
+
+    async def dispatch(self, method, target):
+        """Обрабатывает запрос и возвращает (код ответа, тело в JSON)."""
+        if method != 'GET':
+            return 405, {'error': f"Метод {method} не поддерживается"}
+
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+
+        if url.path == '/health':
+            manager = self.manager
+            return 200, {'status': 'ok' if manager is not None else 'loading',
+                         'rows': len(manager.data_clean) if manager is not None else 0,
+                         'files': self.files}
+
+        handler = ROUTES.get(url.path)
+        if handler is None:
+            return 404, {'error': f"Неизвестный путь {url.path}",
+                         'routes': ['/health'] + sorted(ROUTES)}
+
+        try:
+            method, kwargs = handler(params)
+        except ValueError as e:
+            return 400, {'error': f"Неверные параметры запроса: {e}"}
+
+        manager, lock = self.manager, self._manager_lock
+        if manager is None:
+            return 503, {'error': "Данные ещё не загружены"}
+
+        result = await asyncio.to_thread(self._compute, manager, lock, method, kwargs)
+
+        if result is None:
+            return 200, []
+        # to_json корректно сериализует даты и NaN
+        return 200, json.loads(result.to_json(orient='records', date_format='iso',
+                                              force_ascii=False))
+
+    @staticmethod
+    def _compute(manager, lock, method, kwargs):
+        """Выполняет анализ в рабочем потоке; один менеджер — одно вычисление за раз."""
+        with lock:
+            return getattr(manager, method)(**kwargs)
+
+    async def handle_client(self, reader, writer):
+        """Минимальный HTTP/1.1-обработчик: один запрос на соединение."""
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            # Пропускаем заголовки
+            while True:
+                line = await reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+
+            try:
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                status, payload = await self.dispatch(method, target)
+            except ValueError:
+                status, payload = 400, {'error': "Некорректная строка запроса"}
+            except Exception as e:
+                logger.error(f"ОШИБКА ОБРАБОТКИ ЗАПРОСА: {e}")
+                status, payload = 500, {'error': str(e)}
+
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            head = (f"HTTP/1.1 {status} {HTTP_STATUSES.get(status, 'Internal Server Error')}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: close\r\n\r\n")
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080, unix_path=None):
+        """Загружает данные и обслуживает запросы до остановки процесса."""
+        await self.reload()
+
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+            print(f" Сервис аналитики слушает Unix-сокет {unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+            print(f" Сервис аналитики слушает http://{host}:{port}/")
+
+        watcher = asyncio.create_task(self.watch_files())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резидентный сервис аналитики продаж")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', dest='unix_path', default=None,
+                        help="Путь к Unix-сокету вместо TCP")
+    parser.add_argument('--files', nargs='+', default=DEFAULT_FILES,
+                        help="Исходные CSV-файлы")
+    parser.add_argument('--reload-interval', type=float, default=5.0,
+                        help="Период проверки изменений файлов, сек.")
+    args = parser.parse_args()
+
+    service = AnalyticsService(args.files, reload_interval=args.reload_interval)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix_path))
+    except KeyboardInterrupt:
+        print(" Сервис остановлен.")
+
+
+if __name__ == "__main__":
+    main()
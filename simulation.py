@@ -0,0 +1,235 @@
+"""
+Монте-Карло симуляция политики пополнения запасов.
+
+Для каждого товара по истории дневного спроса (data_clean) разыгрываются
+тысячи сценариев будущего спроса бутстрепом: каждый день сценария — случайно
+выбранный исторический день. История товара начинается с его первого поступления
+или продажи; случайная величина дня общая для всех товаров и отображается
+в собственную историю каждого, поэтому у товаров с общей историей день один
+и тот же и совместные всплески спроса сохраняются. Политика — точка заказа
+(calculate_reorder_point: срок поставки x средний спрос + страховой запас):
+когда запас с учётом заказов в пути опускается до точки заказа, заказывается
+партия, которая приходит через lead_time_days дней. Неудовлетворённый спрос теряется.
+
+Все сценарии и товары считаются одновременно массивами NumPy
+(сценарии x товары, цикл только по дням горизонта); для очень больших
+каталогов товары делятся на блоки, которые можно считать в пуле процессов.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Ограничение на число элементов (сценарии x товары x дни) в одном блоке
+_BLOCK_ELEMENTS = 20_000_000
+
+
+def daily_demand_matrix(star_schema):
+    """
+    Матрица дневного спроса (товары x календарные дни выгрузки) по продажам звёздной схемы.
+    Дни без продаж — нулевой спрос, но только начиная с первого поступления или продажи
+    товара: до этого товара ещё не было, и нули занизили бы средний спрос.
+    Возвращает (матрица, ключи товаров с продажами, номер первого дня истории каждого товара).
+    """
+    fact = star_schema.fact
+    keys = fact['Ключ товара'].to_numpy()
+    operations = fact['Тип операции']
+    is_sale = (operations == 'Продажа').to_numpy() & (keys >= 0)
+    is_purchase = (operations == 'Поступление').to_numpy() & (keys >= 0)
+    is_movement = is_sale | is_purchase
+    all_days = fact['Дата'].dt.normalize().to_numpy()
+    first_date = all_days[is_movement].min()
+    day_codes = ((all_days - first_date) // np.timedelta64(1, 'D')).astype(np.int64)
+    n_days = int(day_codes[is_movement].max()) + 1
+
+    product_codes, product_keys = pd.factorize(keys[is_sale], sort=True)
+    demand = np.bincount(product_codes * n_days + day_codes[is_sale],
+                         weights=fact['Количество упаковок, шт.'].to_numpy(dtype=np.float64)[is_sale],
+                         minlength=len(product_keys) * n_days)
+
+    # Первый день истории — первое поступление или продажа товара
+    first_day = np.full(len(star_schema.products), n_days, dtype=np.int64)
+    np.minimum.at(first_day, keys[is_movement], day_codes[is_movement])
+    return demand.reshape(len(product_keys), n_days), np.asarray(product_keys), first_day[product_keys]
+
+
+def _simulate_block(history, first_day, reorder_point, order_quantity, lead_time_days, uniforms):
+    """
+    Симуляция блока товаров. history — (товары x дни истории), first_day — первый день
+    истории каждого товара, uniforms — (сценарии x дни горизонта) случайные числа
+    из [0, 1), общие для всех блоков: число u выбирает день first_day + u x длина истории.
+    Возвращает словарь метрик по товарам (массивы длины числа товаров).
+    """
+    n_products = history.shape[0]
+    n_scenarios, horizon_days = uniforms.shape
+    history_days = history.shape[1] - first_day
+    rows = np.arange(n_products)
+
+    stock = np.broadcast_to(reorder_point + order_quantity, (n_scenarios, n_products)).astype(np.float64)
+    # Заказы в пути: кольцевой буфер по дням прихода
+    pipeline = np.zeros((lead_time_days + 1, n_scenarios, n_products))
+    on_order = np.zeros((n_scenarios, n_products))
+
+    demand_total = np.zeros((n_scenarios, n_products))
+    served_total = np.zeros((n_scenarios, n_products))
+    stock_total = np.zeros((n_scenarios, n_products))
+    stockout_days = np.zeros((n_scenarios, n_products))
+    orders = np.zeros((n_scenarios, n_products))
+
+    for day in range(horizon_days):
+        # Приход заказов, срок которых наступил
+        slot = day % (lead_time_days + 1)
+        stock += pipeline[slot]
+        on_order -= pipeline[slot]
+        pipeline[slot] = 0
+
+        offset = np.minimum((uniforms[:, day, None] * history_days).astype(np.int64), history_days - 1)
+        demand = history[rows, first_day + offset]  # (сценарии x товары)
+        served = np.minimum(stock, demand)
+        stock -= served
+        demand_total += demand
+        served_total += served
+        stockout_days += demand > served
+        stock_total += stock
+
+        # Проверка точки заказа по запасу с учётом заказов в пути
+        reorder = stock + on_order <= reorder_point
+        if lead_time_days == 0:
+            stock += reorder * order_quantity
+        else:
+            pipeline[(day + lead_time_days) % (lead_time_days + 1)] += reorder * order_quantity
+            on_order += reorder * order_quantity
+        orders += reorder
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fill_rate = np.where(demand_total > 0, served_total / demand_total, 1.0)
+    average_stock = stock_total / horizon_days
+    return {
+        'Уровень_сервиса': fill_rate.mean(axis=0),
+        'Уровень_сервиса_P5': np.percentile(fill_rate, 5, axis=0),
+        'Вероятность_дефицита': (stockout_days > 0).mean(axis=0),
+        'Дней_дефицита': stockout_days.mean(axis=0),
+        'Средний_запас': average_stock.mean(axis=0),
+        'Продано': served_total.mean(axis=0),
+        'Заказов': orders.mean(axis=0),
+    }
+
+
+def _simulate_block_args(args):
+    return _simulate_block(*args)
+
+
+def simulate_stock_policy(demand_history, lead_time_days=7, safety_stock=0, order_days=14,
+                          n_scenarios=1000, horizon_days=90, unit_holding_cost=None,
+                          max_workers=None, seed=None, first_day=None):
+    """
+    Симулирует политику точки заказа для всех товаров сразу.
+    Параметры:
+        demand_history (np.ndarray): Дневной спрос (товары x дни), см. daily_demand_matrix
+        lead_time_days (int): Срок поставки, дней
+        safety_stock (float | np.ndarray): Страховой запас, упаковок (число или по товару)
+        order_days (int): Размер партии в днях среднего спроса
+        n_scenarios (int): Число бутстреп-сценариев
+        horizon_days (int): Горизонт симуляции, дней
+        unit_holding_cost (np.ndarray): Стоимость хранения упаковки в день, руб. (по товару)
+        max_workers (int): Процессов для блоков товаров (None — в текущем процессе)
+        seed (int): Зерно генератора; одно зерно — одни и те же сценарии спроса,
+                    поэтому при сравнении параметров различия даёт только политика
+        first_day (np.ndarray): Первый день истории каждого товара (None — вся история),
+                                см. daily_demand_matrix; более ранние дни не учитываются
+    Возвращает:
+        pd.DataFrame: по строке на товар (в порядке demand_history) — точка заказа, партия,
+                      уровень сервиса (средний и 5-й перцентиль), вероятность и дни дефицита,
+                      средний запас, оборачиваемость, затраты на хранение за горизонт.
+    """
+    history = np.asarray(demand_history, dtype=np.float64)
+    n_products, n_days = history.shape
+    first_day = (np.zeros(n_products, dtype=np.int64) if first_day is None
+                 else np.minimum(np.asarray(first_day, dtype=np.int64), n_days - 1))
+    # Средний спрос — только по дням, когда товар уже был
+    average_daily = history.sum(axis=1) / (n_days - first_day)
+    safety_stock = np.broadcast_to(np.asarray(safety_stock, dtype=np.float64), (n_products,))
+
+    # Та же формула, что calculate_reorder_point, для всех товаров сразу
+    reorder_point = np.floor(lead_time_days * average_daily + safety_stock)
+    order_quantity = np.maximum(np.ceil(average_daily * order_days), 1)
+
+    # Бутстреп: случайное число для каждого (сценарий, день), одно на все товары
+    rng = np.random.default_rng(seed)
+    uniforms = rng.random(size=(n_scenarios, horizon_days))
+
+    # Блоки товаров ограниченного размера (память ~ сценарии x товары x срок поставки)
+    block = max(1, _BLOCK_ELEMENTS // (n_scenarios * max(lead_time_days + 1, 8)))
+    tasks = [(history[start:start + block], first_day[start:start + block],
+              reorder_point[start:start + block], order_quantity[start:start + block],
+              int(lead_time_days), uniforms)
+             for start in range(0, n_products, block)]
+
+    if max_workers is not None and max_workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            parts = list(pool.map(_simulate_block_args, tasks))
+    else:
+        parts = [_simulate_block(*task) for task in tasks]
+
+    result = pd.DataFrame({name: np.concatenate([part[name] for part in parts]) for name in parts[0]})
+    result.insert(0, 'Точка_заказа', reorder_point)
+    result.insert(1, 'Партия', order_quantity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['Оборачиваемость'] = np.where(result['Средний_запас'] > 0,
+                                             result['Продано'] / result['Средний_запас'], np.nan)
+    if unit_holding_cost is not None:
+        result['Затраты_на_хранение'] = result['Средний_запас'] * np.asarray(unit_holding_cost) * horizon_days
+    logger.info(f"Симуляция: {n_products} товаров x {n_scenarios} сценариев x {horizon_days} дней, "
+                f"срок поставки {lead_time_days} дн.")
+    return result
+
+
+def simulate_reorder_settings(star_schema, settings=((7, 0),), n_scenarios=1000, horizon_days=90,
+                              order_days=14, holding_rate=0.25, max_workers=None, seed=None):
+    """
+    Сравнивает варианты параметров точки заказа по всем товарам.
+    settings — пары (срок поставки в днях, страховой запас в упаковках).
+    Все варианты считаются на одних и тех же сценариях спроса (общие случайные числа),
+    поэтому различия между ними не смешиваются с шумом выборки.
+    Стоимость хранения упаковки в день — средняя цена продажи x holding_rate / 365.
+    Возвращает DataFrame: 'Артикул', 'Название товара', 'Срок_поставки', 'Страховой_запас'
+    и метрики simulate_stock_policy — по строке на товар и вариант.
+    """
+    if star_schema is None:
+        logger.warning("Нет данных для симуляции запасов.")
+        return None
+    try:
+        history, product_keys, first_day = daily_demand_matrix(star_schema)
+
+        # Средняя цена продажи упаковки по товару (взвешенная по количеству)
+        fact = star_schema.fact
+        keys = fact['Ключ товара'].to_numpy()
+        is_sale = (fact['Тип операции'] == 'Продажа').to_numpy() & (keys >= 0)
+        n_all = len(star_schema.products)
+        quantity = np.bincount(keys[is_sale], weights=fact['Количество упаковок, шт.'].to_numpy()[is_sale],
+                               minlength=n_all)
+        amount = np.bincount(keys[is_sale], weights=fact['Сумма операции'].to_numpy()[is_sale],
+                             minlength=n_all)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price = np.where(quantity > 0, amount / quantity, 0)[product_keys]
+        unit_holding_cost = price * holding_rate / 365
+
+        names = star_schema.products[['Артикул', 'Название товара']].iloc[product_keys].reset_index(drop=True)
+        # Одно зерно на все варианты — одинаковые сценарии спроса
+        seed = np.random.SeedSequence(seed).entropy
+        results = []
+        for lead_time_days, safety_stock in settings:
+            simulated = simulate_stock_policy(
+                history, lead_time_days=lead_time_days, safety_stock=safety_stock, order_days=order_days,
+                n_scenarios=n_scenarios, horizon_days=horizon_days, unit_holding_cost=unit_holding_cost,
+                max_workers=max_workers, seed=seed, first_day=first_day)
+            simulated.insert(0, 'Срок_поставки', lead_time_days)
+            simulated.insert(1, 'Страховой_запас', safety_stock)
+            results.append(pd.concat([names, simulated], axis=1))
+        return pd.concat(results, ignore_index=True)
+    except Exception as e:
+        logger.error(f"ОШИБКА ПРИ СИМУЛЯЦИИ ЗАПАСОВ: {e}")
+        return None
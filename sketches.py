@@ -0,0 +1,309 @@
+"""
+Приближённая потоковая аналитика с ограниченной памятью.
+
+Скетчи обновляются порциями (chunk за chunk'ом), объединяются между файлами
+методом merge() и занимают фиксированный объём памяти независимо от числа строк:
+
+    HyperLogLog        — число уникальных значений (артикулов в отделе).
+                         Память 2^p байт; стандартная ошибка ≈ 1.04 / sqrt(2^p)
+                         (p=14: 16 КБ, ≈ 0.8%).
+    CountMinSketch     — оценка суммы по ключу (количество/выручка товара).
+                         Память width x depth; оценка не меньше истинной и с
+                         вероятностью 1 - exp(-depth) превышает её не более чем на
+                         e / width * N, где N — общая сумма.
+    HeavyHitters       — кандидаты в топ-N (алгоритм Misra–Gries, эквивалентный
+                         Space-Saving). Хранит k счётчиков; оценка не больше истинной
+                         и занижена не более чем на N / (k + 1). Любой ключ с долей
+                         больше 1 / (k + 1) гарантированно присутствует.
+    QuantileSketch     — квантили распределения цен (DDSketch). Относительная ошибка
+                         квантиля не больше relative_accuracy; число корзин
+                         ограничено max_bins.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from process import iter_sales_chunks, preprocess_data
+
+logger = logging.getLogger(__name__)
+
+# Ключи хэширования (ровно 16 символов) для двух независимых хэш-функций
+_HASH_KEY_1 = '0123456789123456'
+_HASH_KEY_2 = 'inventory_sketch'
+
+
+def _hash64(values, hash_key=_HASH_KEY_1):
+    """64-битные хэши значений; значения приводятся к строкам, чтобы 12 и '12' совпадали."""
+    return pd.util.hash_pandas_object(pd.Series(values).astype(str), index=False,
+                                      hash_key=hash_key).to_numpy()
+
+
+def _bit_length(x):
+    """Векторная длина в битах для массива uint64 (0 для нуля)."""
+    x = x.copy()
+    length = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = x >= (np.uint64(1) << np.uint64(shift))
+        length[mask] += shift
+        x[mask] >>= np.uint64(shift)
+    return length + (x > 0)
+
+
+class HyperLogLog:
+    """Оценка числа уникальных значений. Память — 2^p однобайтовых регистров."""
+
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        h = _hash64(values)
+        index = (h >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = h << np.uint64(self.p)
+        # Позиция первой единицы в оставшихся 64 - p битах
+        rank = np.minimum(64 - _bit_length(rest) + 1, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Нельзя объединить HyperLogLog с разной точностью")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m ** 2 / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Поправка для малых мощностей (linear counting)
+        if raw <= 2.5 * self.m and zeros > 0:
+            return self.m * np.log(self.m / zeros)
+        return float(raw)
+
+
+class CountMinSketch:
+    """Оценка сумм по ключам: таблица depth x width счётчиков."""
+
+    def __init__(self, width=2 ** 14, depth=5):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.float64)
+        self.total = 0.0
+
+    def _buckets(self, keys):
+        h1 = _hash64(keys, _HASH_KEY_1)
+        h2 = _hash64(keys, _HASH_KEY_2) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((h1[None, :] + rows * h2[None, :]) % np.uint64(self.width)).astype(np.int64)
+
+    def update(self, keys, weights):
+        if len(keys) == 0:
+            return
+        weights = np.asarray(weights, dtype=np.float64)
+        buckets = self._buckets(keys)
+        for row in range(self.depth):
+            self.table[row] += np.bincount(buckets[row], weights=weights, minlength=self.width)
+        self.total += float(weights.sum())
+
+    def estimate(self, keys):
+        buckets = self._buckets(keys)
+        return self.table[np.arange(self.depth)[:, None], buckets].min(axis=0)
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Нельзя объединить Count-Min скетчи разного размера")
+        self.table += other.table
+        self.total += other.total
+
+
+class HeavyHitters:
+    """Mergeable Misra–Gries: не более k отслеживаемых ключей."""
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.counters = pd.Series(dtype=np.float64)
+        self.total = 0.0
+
+    def _compact(self, counters):
+        if len(counters) > self.k:
+            # Вычитаем (k+1)-й по величине счётчик и оставляем положительные
+            threshold = np.partition(counters.to_numpy(), -(self.k + 1))[-(self.k + 1)]
+            counters = counters - threshold
+            counters = counters[counters > 0]
+        return counters
+
+    def update(self, keys, weights):
+        if len(keys) == 0:
+            return
+        chunk = pd.Series(np.asarray(weights, dtype=np.float64), index=pd.Index(keys)).groupby(level=0).sum()
+        self.total += float(chunk.sum())
+        self.counters = self._compact(self.counters.add(chunk, fill_value=0))
+
+    def merge(self, other):
+        self.total += other.total
+        self.counters = self._compact(self.counters.add(other.counters, fill_value=0))
+
+    def top(self, n):
+        return self.counters.nlargest(n)
+
+
+class QuantileSketch:
+    """DDSketch: логарифмические корзины с относительной точностью relative_accuracy."""
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.max_bins = max_bins
+        self.bins = pd.Series(dtype=np.int64)
+        self.zero_count = 0
+        self.count = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        positive = values[values > 0]
+        self.zero_count += int(len(values) - len(positive))
+        self.count += int(len(values))
+        index, counts = np.unique(np.ceil(np.log(positive) / np.log(self.gamma)).astype(np.int64),
+                                  return_counts=True)
+        self._add_bins(pd.Series(counts, index=index))
+
+    def _add_bins(self, bins):
+        self.bins = self.bins.add(bins, fill_value=0).astype(np.int64).sort_index()
+        if len(self.bins) > self.max_bins:
+            # Сливаем младшие корзины: точность сохраняется для верхних квантилей
+            overflow = len(self.bins) - self.max_bins + 1
+            merged_count = self.bins.iloc[:overflow].sum()
+            self.bins = self.bins.iloc[overflow:].copy()
+            self.bins.iloc[0] += merged_count
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Нельзя объединить квантильные скетчи с разной точностью")
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self._add_bins(other.bins)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.nan
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = np.cumsum(self.bins.to_numpy()) + self.zero_count
+        position = int(np.searchsorted(cumulative, rank, side='right'))
+        position = min(position, len(self.bins) - 1)
+        index = self.bins.index[position]
+        return float(2 * self.gamma ** index / (self.gamma + 1))
+
+
+class SalesSketch:
+    """
+    Набор скетчей по продажам: уникальные артикулы по отделам, топ товаров
+    по количеству и выручке, квантили цен. Обновляется очищенными порциями данных.
+    """
+
+    def __init__(self, hll_precision=14, heavy_hitters_k=1000, cms_width=2 ** 14, cms_depth=5,
+                 relative_accuracy=0.01):
+        self.hll_precision = hll_precision
+        self.distinct_skus = {}  # отдел -> HyperLogLog
+        self.top_quantity = HeavyHitters(heavy_hitters_k)
+        self.top_revenue = HeavyHitters(heavy_hitters_k)
+        self.cms_quantity = CountMinSketch(cms_width, cms_depth)
+        self.cms_revenue = CountMinSketch(cms_width, cms_depth)
+        self.prices = QuantileSketch(relative_accuracy)
+        self.rows = 0
+
+    def update(self, data_clean):
+        """Добавляет порцию очищенных данных (используются только продажи)."""
+        if data_clean is None or len(data_clean) == 0:
+            return
+        sales = data_clean[data_clean['Тип операции'] == 'Продажа']
+        self.rows += len(sales)
+        if len(sales) == 0:
+            return
+
+        for department, skus in sales.groupby('Отдел товара')['Артикул']:
+            if department not in self.distinct_skus:
+                self.distinct_skus[department] = HyperLogLog(self.hll_precision)
+            self.distinct_skus[department].update(skus.to_numpy())
+
+        # Ключ товара — пара (артикул, название), как в get_top_n_products
+        keys = (sales['Артикул'].astype(str) + '\x1f' + sales['Название товара'].astype(str)).to_numpy()
+        quantity = sales['Количество упаковок, шт.'].to_numpy(dtype=np.float64)
+        revenue = sales['Сумма операции'].to_numpy(dtype=np.float64)
+        self.top_quantity.update(keys, quantity)
+        self.top_revenue.update(keys, revenue)
+        self.cms_quantity.update(keys, quantity)
+        self.cms_revenue.update(keys, revenue)
+        self.prices.update(sales['Цена руб./шт.'].to_numpy())
+
+    def merge(self, other):
+        """Объединяет скетч другого файла/процесса с текущим."""
+        for department, hll in other.distinct_skus.items():
+            if department not in self.distinct_skus:
+                self.distinct_skus[department] = HyperLogLog(self.hll_precision)
+            self.distinct_skus[department].merge(hll)
+        self.top_quantity.merge(other.top_quantity)
+        self.top_revenue.merge(other.top_revenue)
+        self.cms_quantity.merge(other.cms_quantity)
+        self.cms_revenue.merge(other.cms_revenue)
+        self.prices.merge(other.prices)
+        self.rows += other.rows
+
+    def distinct_skus_by_department(self):
+        """Приближённое число уникальных артикулов по отделам ('Уникальных_товаров')."""
+        return pd.DataFrame({
+            'Отдел товара': list(self.distinct_skus),
+            'Уникальных_товаров': [round(hll.estimate()) for hll in self.distinct_skus.values()]
+        }).sort_values('Отдел товара').reset_index(drop=True)
+
+    def top_products(self, n=5, metric='quantity'):
+        """
+        Приближённый топ-N товаров. 'Нижняя_оценка' — счётчик Misra–Gries,
+        'Оценка' — Count-Min (истинное значение лежит между ними с высокой вероятностью).
+        """
+        if metric not in ['quantity', 'revenue']:
+            logger.error(f" НЕВЕРНАЯ МЕТРИКА: {metric}. Допустимо: 'quantity' или 'revenue'")
+            return None
+        heavy, cms = ((self.top_quantity, self.cms_quantity) if metric == 'quantity'
+                      else (self.top_revenue, self.cms_revenue))
+        candidates = heavy.top(max(n * 3, n))
+        if candidates.empty:
+            return pd.DataFrame(columns=['Артикул', 'Название товара', 'Оценка', 'Нижняя_оценка'])
+        keys = candidates.index.to_numpy()
+        result = pd.DataFrame({'key': keys, 'Оценка': cms.estimate(keys),
+                               'Нижняя_оценка': candidates.to_numpy()})
+        result = result.sort_values('Оценка', ascending=False).head(n)
+        parts = result['key'].str.split('\x1f', n=1, expand=True)
+        sku = pd.to_numeric(parts[0], errors='coerce')
+        result.insert(0, 'Артикул', parts[0] if sku.isna().any() else sku)
+        result.insert(1, 'Название товара', parts[1])
+        return result.drop(columns=['key']).reset_index(drop=True)
+
+    def price_quantiles(self, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        """Приближённые квантили цены продажи."""
+        return pd.DataFrame({'Квантиль': list(quantiles),
+                             'Цена руб./шт.': [self.prices.quantile(q) for q in quantiles]})
+
+
+def sketch_sales_files(files, chunksize=100_000, sketch=None):
+    """
+    Потоково строит SalesSketch по CSV-файлам: каждый файл читается по частям,
+    части предобрабатываются и сразу сворачиваются в скетч.
+    Скетчи отдельных файлов объединяются через merge().
+    """
+    total = sketch if sketch is not None else SalesSketch()
+    for file in files:
+        file_sketch = SalesSketch(total.hll_precision, total.top_quantity.k,
+                                  total.cms_quantity.width, total.cms_quantity.depth,
+                                  total.prices.relative_accuracy)
+        for chunk in iter_sales_chunks(file, chunksize):
+            file_sketch.update(preprocess_data(chunk))
+        total.merge(file_sketch)
+        logger.info(f"Скетч по файлу {file} построен: {file_sketch.rows} строк продаж.")
+    return total
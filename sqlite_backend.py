@@ -0,0 +1,381 @@
+"""
+Альтернативный бэкенд аналитики на SQLite (стандартный модуль sqlite3).
+
+Очищенные строки (data_clean) один раз загружаются в таблицу operations
+с индексами по дате, артикулу, типу операции и магазину, после чего анализы
+из process.py выполняются индексированными SQL-запросами. Для повторных запросов
+по большой истории не нужно держать все строки в памяти pandas: достаточно
+открыть существующий файл базы.
+
+Результаты совпадают с результатами pandas-функций из process.py;
+проверка — функция check_parity() (запуск: python check_sqlite_parity.py).
+"""
+import logging
+import sqlite3
+
+import pandas as pd
+
+from process import (
+    is_valid_period,
+    calculate_revenue_by_period,
+    calculate_profit_by_period,
+    aggregate_sales_by_category,
+    get_top_n_products,
+    analyze_inventory_turnover,
+    identify_slow_moving_items,
+    build_star_schema
+)
+
+logger = logging.getLogger(__name__)
+
+# Столбец data_clean -> столбец таблицы operations
+COLUMN_MAP = {
+    'ID операции': 'op_id',
+    'Дата': 'op_date',
+    'Адрес магазина': 'store',
+    'Район магазина': 'district',
+    'Артикул': 'sku',
+    'Название товара': 'name',
+    'Отдел товара': 'department',
+    'Количество упаковок, шт.': 'qty',
+    'Тип операции': 'op_type',
+    'Цена руб./шт.': 'price',
+    'Сумма операции': 'amount',
+}
+
+# Начало периода для гранулярностей, которые считаются целиком в SQL (совпадает с Period.start_time
+# в pandas). Остальные периоды pandas (финансовые 'Q-MAR', 'Y-MAR' и т.п.) считаются по дневным
+# суммам из SQL, которые доводятся до периода в pandas — как resample_daily_rollup
+PERIOD_EXPRESSIONS = {
+    'D': "op_date",
+    'W': "date(op_date, '-6 days', 'weekday 1')",  # понедельник недели
+    'M': "strftime('%Y-%m-01', op_date)",
+    'Q': "printf('%s-%02d-01', strftime('%Y', op_date),"
+         " (CAST(strftime('%m', op_date) AS INTEGER) - 1) / 3 * 3 + 1)",
+    'Y': "strftime('%Y-01-01', op_date)",
+}
+
+SALE = 'Продажа'
+PURCHASE = 'Поступление'
+
+# Строки с пропуском в ключе товара не попадают в группировки pandas (groupby отбрасывает NaN)
+PRODUCT_KEY_PRESENT = "sku IS NOT NULL AND name IS NOT NULL"
+
+# Периоды, которые сверяет check_parity: все SQL-выражения и финансовые периоды
+PARITY_PERIODS = list(PERIOD_EXPRESSIONS) + ['Q-MAR', 'Y-MAR']
+
+
+def _resample_periods(frame, period):
+    """Дневные суммы (period_start — день) -> суммы по периоду pandas без SQL-выражения."""
+    if period in PERIOD_EXPRESSIONS:
+        return frame
+    starts = frame['period_start'].dt.to_period(period).dt.start_time.rename('period_start')
+    return frame.drop(columns='period_start').groupby(starts, sort=True).sum().reset_index()
+
+
+class SQLiteBackend:
+    """
+    Выполняет анализы process.py как SQL-запросы к локальной базе SQLite.
+    db_path=':memory:' — база в памяти, иначе файл на диске.
+    """
+
+    def __init__(self, db_path=':memory:'):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+
+    def close(self):
+        self.conn.close()
+
+    def ingest(self, data_clean, replace=True):
+        """
+        Загружает очищенные данные в таблицу operations и строит индексы.
+        replace=False дописывает строки к уже существующей таблице.
+        """
+        if data_clean is None or len(data_clean) == 0:
+            logger.warning("Нет данных для загрузки в SQLite.")
+            return False
+
+        try:
+            columns = [c for c in COLUMN_MAP if c in data_clean.columns]
+            df = data_clean[columns].rename(columns=COLUMN_MAP)
+            df['op_date'] = df['op_date'].dt.strftime('%Y-%m-%d')
+
+            df.to_sql('operations', self.conn, if_exists='replace' if replace else 'append',
+                      index=False, chunksize=50_000)
+            cur = self.conn.cursor()
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_ops_date ON operations(op_date)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_ops_sku ON operations(sku)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_ops_type_date ON operations(op_type, op_date)")
+            if 'store' in df.columns:
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_ops_store ON operations(store)")
+            self.conn.commit()
+            logger.info(f"В SQLite ({self.db_path}) загружено {len(df)} строк.")
+            return True
+        except Exception as e:
+            logger.error(f"ОШИБКА ЗАГРУЗКИ ДАННЫХ В SQLITE: {e}")
+            return False
+
+    def _query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def _has_operation(self, operation_type):
+        row = self.conn.execute(
+            "SELECT 1 FROM operations WHERE op_type = ? LIMIT 1", (operation_type,)).fetchone()
+        return row is not None
+
+    def revenue_by_period(self, period='D'):
+        """Аналог calculate_revenue_by_period."""
+        if not is_valid_period(period):
+            logger.error(f"ОШИБКА ПРИ РАСЧЁТЕ ВЫРУЧКИ ПО ПЕРИОДУ {period}: период не поддерживается")
+            return None
+        try:
+            revenue_data = self._query(f"""
+                SELECT {PERIOD_EXPRESSIONS.get(period, 'op_date')} AS period_start, SUM(amount) AS revenue
+                FROM operations
+                WHERE op_type = ?
+                GROUP BY period_start
+                ORDER BY period_start
+            """, (SALE,))
+            if revenue_data.empty:
+                logger.warning("Нет данных о продажах для расчёта выручки.")
+                return None
+            revenue_data['period_start'] = pd.to_datetime(revenue_data['period_start'])
+            revenue_data = _resample_periods(revenue_data, period)
+            return revenue_data.rename(columns={'period_start': 'Дата', 'revenue': 'Выручка'})
+        except Exception as e:
+            logger.error(f"ОШИБКА ПРИ РАСЧЁТЕ ВЫРУЧКИ ПО ПЕРИОДУ {period}: {e}")
+            return None
+
+    def profit_by_period(self, period='D'):
+        """Аналог calculate_profit_by_period."""
+        if not is_valid_period(period):
+            logger.error(f"ОШИБКА ПРИ РАСЧЁТЕ ПРИБЫЛИ ПО ПЕРИОДУ {period}: период не поддерживается")
+            return None
+        if not self._has_operation(SALE) or not self._has_operation(PURCHASE):
+            logger.warning("Нет данных о продажах или поступлениях.")
+            return None
+        try:
+            profit_data = self._query(f"""
+                SELECT {PERIOD_EXPRESSIONS.get(period, 'op_date')} AS period_start,
+                       SUM(CASE WHEN op_type = :sale THEN amount ELSE 0 END) AS sales,
+                       SUM(CASE WHEN op_type = :purchase THEN amount ELSE 0 END) AS purchases
+                FROM operations
+                WHERE op_type IN (:sale, :purchase)
+                GROUP BY period_start
+                ORDER BY period_start
+            """, {'sale': SALE, 'purchase': PURCHASE})
+            profit_data['period_start'] = pd.to_datetime(profit_data['period_start'])
+            # Разность — после суммирования по периоду, как в calculate_profit_by_period
+            profit_data = _resample_periods(profit_data, period)
+            profit_data['profit'] = profit_data.pop('sales') - profit_data.pop('purchases')
+            return profit_data.rename(columns={'period_start': 'Дата', 'profit': 'Прибыль'})
+        except Exception as e:
+            logger.error(f"ОШИБКА ПРИ РАСЧЁТЕ ПРИБЫЛИ ПО ПЕРИОДУ {period}: {e}")
+            return None
+
+    def sales_by_category(self):
+        """Аналог aggregate_sales_by_category."""
+        if not self._has_operation(SALE):
+            logger.warning("Нет данных о продажах.")
+            return None
+        try:
+            category_stats = self._query("""
+                WITH sales AS (
+                    SELECT department, SUM(amount) AS revenue, SUM(qty) AS sold,
+                           COUNT(DISTINCT sku) AS unique_skus
+                    FROM operations WHERE op_type = :sale GROUP BY department
+                ), purchases AS (
+                    SELECT department, SUM(qty) AS received
+                    FROM operations WHERE op_type = :purchase GROUP BY department
+                )
+                SELECT s.department, s.revenue, s.sold, s.unique_skus,
+                       COALESCE(p.received, 0) AS received,
+                       s.sold - COALESCE(p.received, 0) AS balance
+                FROM sales s LEFT JOIN purchases p ON p.department = s.department
+                ORDER BY s.department
+            """, {'sale': SALE, 'purchase': PURCHASE})
+            return category_stats.rename(columns={
+                'department': 'Отдел товара',
+                'revenue': 'Выручка',
+                'sold': 'Проданных_единиц',
+                'unique_skus': 'Уникальных_товаров',
+                'received': 'Поступило_единиц',
+                'balance': 'Остаток_от_продаж'
+            })
+        except Exception as e:
+            logger.error(f"ОШИБКА ПРИ АГРЕГАЦИИ ПО КАТЕГОРИЯМ (SQLITE): {e}")
+            return None
+
+    def top_n_products(self, n=5, metric='quantity'):
+        """Аналог get_top_n_products."""
+        if metric not in ['quantity', 'revenue']:
+            logger.error(f" НЕВЕРНАЯ МЕТРИКА: {metric}. Допустимо: 'quantity' или 'revenue'")
+            return None
+        if not self._has_operation(SALE):
+            logger.warning("Нет данных о продажах.")
+            return None
+        order_column = 'qty_total' if metric == 'quantity' else 'revenue'
+        try:
+            top_products = self._query(f"""
+                SELECT sku, name, SUM(amount) AS revenue, SUM(qty) AS qty_total
+                FROM operations
+                WHERE op_type = ? AND {PRODUCT_KEY_PRESENT}
+                GROUP BY sku, name
+                ORDER BY {order_column} DESC, sku, name
+                LIMIT ?
+            """, (SALE, -1 if n is None else n))  # LIMIT -1 — все строки
+            return top_products.rename(columns={
+                'sku': 'Артикул',
+                'name': 'Название товара',
+                'revenue': 'Выручка',
+                'qty_total': 'Кол-во_упаковок'
+            })
+        except Exception as e:
+            logger.error(f"ОШИБКА ПРИ ПОИСКЕ ТОП-ПРОДУКТОВ (SQLITE): {e}")
+            return None
+
+    def inventory_turnover(self, top_n=10):
+        """Аналог analyze_inventory_turnover."""
+        if not self._has_operation(SALE) or not self._has_operation(PURCHASE):
+            logger.warning("Нет данных о продажах или поступлениях.")
+            return None
+        try:
+            inventory_analysis = self._query(f"""
+                SELECT sku, name,
+                       SUM(CASE WHEN op_type = :sale THEN qty ELSE 0 END) AS sold,
+                       SUM(CASE WHEN op_type = :sale THEN amount ELSE 0 END) AS revenue,
+                       SUM(CASE WHEN op_type = :purchase THEN qty ELSE 0 END) AS received
+                FROM operations
+                WHERE op_type IN (:sale, :purchase) AND {PRODUCT_KEY_PRESENT}
+                GROUP BY sku, name
+                ORDER BY ABS(sold - received) DESC, sku, name
+                LIMIT :top_n
+            """, {'sale': SALE, 'purchase': PURCHASE, 'top_n': -1 if top_n is None else top_n})
+            inventory_analysis['diff'] = inventory_analysis['sold'] - inventory_analysis['received']
+            return inventory_analysis.rename(columns={
+                'sku': 'Артикул',
+                'name': 'Название товара',
+                'sold': 'Продано_упаковок',
+                'revenue': 'Выручка_от_продаж',
+                'received': 'Поступлено_упаковок',
+                'diff': 'Разница_упаковок'
+            })
+        except Exception as e:
+            logger.error(f"ОШИБКА ПРИ АНАЛИЗЕ ОБОРАЧИВАЕМОСТИ (SQLITE): {e}")
+            return None
+
+    def slow_moving_items(self, days_back=90, sales_threshold=5, as_of=None):
+        """Аналог identify_slow_moving_items."""
+        as_of = pd.Timestamp.now().normalize() if as_of is None else pd.Timestamp(as_of)
+        cutoff = as_of - pd.Timedelta(days=days_back)
+        # Граница не входит в период, как в identify_slow_moving_items. Даты хранятся как
+        # 'YYYY-MM-DD'; строковое сравнение с полуночью должно давать равенство
+        cutoff_str = (cutoff.strftime('%Y-%m-%d') if cutoff == cutoff.normalize()
+                      else cutoff.strftime('%Y-%m-%d %H:%M:%S.%f'))
+        columns = ['Артикул', 'Название товара', 'Продано за период',
+                   'Текущий остаток', 'Дней с последней продажи']
+        try:
+            slow_moving = self._query(f"""
+                WITH inventory AS (
+                    SELECT sku, name,
+                           SUM(CASE WHEN op_type = :purchase THEN qty ELSE 0 END)
+                         - SUM(CASE WHEN op_type = :sale THEN qty ELSE 0 END) AS stock
+                    FROM operations
+                    WHERE op_type IN (:sale, :purchase) AND {PRODUCT_KEY_PRESENT}
+                    GROUP BY sku, name
+                ), recent AS (
+                    SELECT sku, name, SUM(qty) AS sold_period, MAX(op_date) AS last_sale
+                    FROM operations
+                    WHERE op_type = :sale AND op_date > :cutoff AND {PRODUCT_KEY_PRESENT}
+                    GROUP BY sku, name
+                )
+                SELECT i.sku, i.name, COALESCE(r.sold_period, 0) AS sold_period,
+                       i.stock, r.last_sale
+                FROM inventory i
+                LEFT JOIN recent r ON r.sku = i.sku AND r.name = i.name
+                WHERE i.stock > 0 AND COALESCE(r.sold_period, 0) <= :threshold
+            """, {'sale': SALE, 'purchase': PURCHASE, 'cutoff': cutoff_str,
+                  'threshold': sales_threshold})
+        except Exception as e:
+            logger.error(f"ОШИБКА ПРИ ПОИСКЕ МЕДЛЕННО ДВИЖУЩИХСЯ ТОВАРОВ (SQLITE): {e}")
+            return None
+
+        if slow_moving.empty:
+            return pd.DataFrame(columns=columns)
+        slow_moving['days'] = (as_of - pd.to_datetime(slow_moving['last_sale'])).dt.days
+        slow_moving = slow_moving.rename(columns={
+            'sku': 'Артикул',
+            'name': 'Название товара',
+            'sold_period': 'Продано за период',
+            'stock': 'Текущий остаток',
+            'days': 'Дней с последней продажи'
+        })
+        # Порядок сортировки как в identify_slow_moving_items
+        slow_moving = slow_moving.sort_values(
+            ['Продано за период', 'Дней с последней продажи', 'Артикул', 'Название товара'],
+            ascending=[True, False, True, True], kind='stable')
+        return slow_moving[columns].reset_index(drop=True)
+
+
+def _frames_equal(expected, actual):
+    """
+    Точное сравнение результатов двух бэкендов. Допускается только различие
+    целочисленного и вещественного типа одного столбца (SQLite не хранит dtype pandas);
+    значения, имена и порядок столбцов и строк, даты и пропуски должны совпадать.
+    """
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    if expected.empty and actual.empty:
+        # У пустого результата SQL нет типов столбцов — сравниваются только имена
+        return list(expected.columns) == list(actual.columns)
+    expected, actual = expected.reset_index(drop=True), actual.reset_index(drop=True)
+    for column in expected.columns.intersection(actual.columns):
+        left, right = expected[column].dtype, actual[column].dtype
+        if left != right and all(pd.api.types.is_numeric_dtype(t) and not pd.api.types.is_bool_dtype(t)
+                                 for t in (left, right)):
+            expected[column] = expected[column].astype('float64')
+            actual[column] = actual[column].astype('float64')
+    try:
+        pd.testing.assert_frame_equal(expected, actual, check_exact=True)
+        return True
+    except AssertionError as e:
+        logger.error(f"РАСХОЖДЕНИЕ РЕЗУЛЬТАТОВ PANDAS И SQLITE: {e}")
+        return False
+
+
+def check_parity(data_clean, backend=None, as_of=None):
+    """
+    Сверяет результаты SQLite-бэкенда с pandas-функциями process.py
+    на одних и тех же данных. Возвращает словарь {анализ: True/False}.
+    Запускается скриптом check_sqlite_parity.py.
+    """
+    if backend is None:
+        backend = SQLiteBackend()
+        backend.ingest(data_clean)
+    as_of = pd.Timestamp.now().normalize() if as_of is None else pd.Timestamp(as_of)
+
+    results = {}
+    for period in PARITY_PERIODS:
+        results[f'revenue_{period}'] = _frames_equal(
+            calculate_revenue_by_period(data_clean, period), backend.revenue_by_period(period))
+        results[f'profit_{period}'] = _frames_equal(
+            calculate_profit_by_period(data_clean, period), backend.profit_by_period(period))
+    results['category'] = _frames_equal(
+        aggregate_sales_by_category(data_clean), backend.sales_by_category())
+    # Одна звёздная схема на все товарные анализы, а не новая в каждом вызове
+    star = build_star_schema(data_clean)
+    # Строки сравниваются в выданном порядке: при равных значениях метрики оба бэкенда
+    # упорядочивают по (Артикул, Название товара), поэтому совпадает и отсечение топа.
+    # Полные таблицы (n=None) проверяют и состав товаров без отсечения по топу
+    for metric in ['quantity', 'revenue']:
+        for n in [10, None]:
+            results[f'top_{metric}_{n or "all"}'] = _frames_equal(
+                get_top_n_products(data_clean, n, metric, star_schema=star), backend.top_n_products(n, metric))
+    for top_n in [10, None]:
+        results[f'turnover_{top_n or "all"}'] = _frames_equal(
+            analyze_inventory_turnover(data_clean, top_n, star_schema=star), backend.inventory_turnover(top_n))
+    for days_back in [7, 90, 10_000]:
+        results[f'slow_moving_{days_back}'] = _frames_equal(
+            identify_slow_moving_items(data_clean, days_back, 5, as_of=as_of, star_schema=star),
+            backend.slow_moving_items(days_back, 5, as_of=as_of))
+    return results
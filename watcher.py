@@ -0,0 +1,188 @@
+"""
+Режим наблюдения за папкой с выгрузками.
+
+Папка опрашивается раз в poll_interval секунд (без внешних зависимостей):
+для каждого CSV-файла сравнивается снимок (размер, время изменения).
+Изменения копятся, пока файлы не перестанут меняться debounce секунд,
+и только потом пачка отправляется в очередь перестроения. Очередь ограничена
+(по умолчанию одна ожидающая пачка), а перестроения выполняет один обработчик,
+поэтому поток новых файлов не запускает пересекающиеся полные перестроения:
+пока идёт перестроение, новые изменения сливаются в следующую пачку.
+
+Перечитываются только изменившиеся файлы — разобранные таблицы остальных
+берутся из памяти; затем заново выполняются дедупликация, предобработка,
+текстовый отчёт и графики.
+
+Пример запуска:
+    python main.py --watch incoming/
+"""
+import asyncio
+import glob
+import logging
+import os
+import time
+
+from manager import InventoryManager, _load_plotting
+from metrics import LAST_RUN_SUCCESS, LAST_RUN_TIMESTAMP, RUN_SECONDS
+from process import load_sales_data
+from report import build_text_report, save_report_to_file
+
+logger = logging.getLogger(__name__)
+
+
+def _file_signature(path):
+    """(размер, время изменения) файла или None, если файл недоступен."""
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+class CachedReader:
+    """
+    Функция чтения для InventoryManager.load_files: файл разбирается заново
+    только если изменился его снимок, иначе возвращается таблица из памяти.
+    """
+
+    def __init__(self):
+        self._frames = {}
+        self.reads = 0
+
+    def __call__(self, path):
+        signature = _file_signature(path)
+        cached = self._frames.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        data = load_sales_data(path)
+        self.reads += 1
+        if data is not None:
+            self._frames[path] = (signature, data)
+        return data
+
+    def forget(self, paths):
+        """Удаляет из памяти таблицы файлов, которых больше нет."""
+        for path in paths:
+            self._frames.pop(path, None)
+
+
+class FolderWatcher:
+    """
+    Следит за input_dir и при изменениях перестраивает inventory_report.txt
+    и графики в visualizations_dir. on_rebuild(success) вызывается после каждого
+    перестроения, когда метрики запуска уже обновлены (например, запись метрик в файл).
+    """
+
+    def __init__(self, input_dir, pattern='*.csv', poll_interval=2.0, debounce=5.0,
+                 report_path='inventory_report.txt', visualizations_dir='sales_visualizations',
+                 charts=True, queue_size=1, on_rebuild=None):
+        self.input_dir = input_dir
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.report_path = report_path
+        self.visualizations_dir = visualizations_dir
+        self.charts = charts
+        self.on_rebuild = on_rebuild
+        self.reader = CachedReader()
+        self.rebuilds = 0
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._snapshot = {}
+
+    def scan(self):
+        """Снимок папки: {путь: (размер, время изменения)}."""
+        snapshot = {}
+        for path in sorted(glob.glob(os.path.join(self.input_dir, self.pattern))):
+            signature = _file_signature(path)
+            if signature is not None:
+                snapshot[path] = signature
+        return snapshot
+
+    def rebuild(self, changed):
+        """Перечитывает изменившиеся файлы и перестраивает отчёт и графики (в рабочем потоке)."""
+        files = sorted(self._snapshot)
+        removed = [path for path in changed if path not in self._snapshot]
+        self.reader.forget(removed)
+        if not files:
+            logger.warning(f"В папке {self.input_dir} нет файлов {self.pattern} — отчёт не обновлён.")
+            return False
+
+        reads_before = self.reader.reads
+        manager = InventoryManager()
+        if not manager.load_files(files, reader=self.reader) or not manager.preprocess():
+            logger.error("ПЕРЕСТРОЕНИЕ ОТЧЁТА НЕ УДАЛОСЬ: данные не загружены.")
+            return False
+        logger.info(f"Перечитано файлов: {self.reader.reads - reads_before} из {len(files)}.")
+
+        save_report_to_file(build_text_report(manager), filename=self.report_path)
+        if self.charts:
+            plt = _load_plotting(headless=True)
+            manager.create_comprehensive_report(output_dir=self.visualizations_dir)
+            plt.close('all')
+        self.rebuilds += 1
+        return True
+
+    async def poll(self):
+        """Опрашивает папку, выжидает паузу в изменениях и ставит пачку в очередь."""
+        pending = set()
+        last_change = None
+        while True:
+            snapshot = self.scan()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            if changed:
+                pending |= changed
+                last_change = asyncio.get_running_loop().time()
+                self._snapshot = snapshot
+
+            quiet = last_change is not None and \
+                asyncio.get_running_loop().time() - last_change >= self.debounce
+            if pending and quiet:
+                try:
+                    self._queue.put_nowait(frozenset(pending))
+                    pending, last_change = set(), None
+                except asyncio.QueueFull:
+                    # Перестроение уже ждёт в очереди: изменения войдут в следующую пачку
+                    pass
+            await asyncio.sleep(self.poll_interval)
+
+    async def work(self):
+        """Единственный обработчик очереди: перестроения идут строго по одному."""
+        while True:
+            changed = await self._queue.get()
+            logger.info(f"Изменились файлы ({len(changed)}): {', '.join(sorted(changed))}")
+            started = time.perf_counter()
+            success = False
+            try:
+                success = await asyncio.to_thread(self.rebuild, changed)
+            except Exception as e:
+                logger.error(f"ОШИБКА ПРИ ПЕРЕСТРОЕНИИ ОТЧЁТА: {e}")
+            finally:
+                RUN_SECONDS.observe(time.perf_counter() - started)
+                LAST_RUN_TIMESTAMP.set(time.time())
+                LAST_RUN_SUCCESS.set(1 if success else 0)
+                if self.on_rebuild is not None:
+                    self.on_rebuild(success)
+                self._queue.task_done()
+
+    async def run(self):
+        """Запускает опрос и обработчик; первая пачка — все файлы папки."""
+        os.makedirs(self.input_dir, exist_ok=True)
+        print(f" Наблюдение за папкой {self.input_dir}/ ({self.pattern}), "
+              f"опрос каждые {self.poll_interval} с, пауза {self.debounce} с. Ctrl+C — выход.")
+        tasks = [asyncio.create_task(self.poll()), asyncio.create_task(self.work())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def watch_folder(input_dir, **options):
+    """Запускает FolderWatcher до прерывания (Ctrl+C)."""
+    watcher = FolderWatcher(input_dir, **options)
+    try:
+        asyncio.run(watcher.run())
+    except KeyboardInterrupt:
+        print(" Наблюдение остановлено.")
+    return watcher